@@ -0,0 +1,115 @@
+"""Per DB aggregates of all DBs at once calculated by grouped NumPy operations"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from app.database_summary import DatabaseSummary, uniformity, weighted_logs
+
+
+class DatabaseAggregateError(Exception):
+    """Database Aggregate Error raised on wrong input arrays"""
+
+
+class DatabaseAggregate:
+    """
+    Image counts, SI and CF extrema and entropy sums of all DBs.
+    Values of all images are kept in single arrays grouped by DB, so each aggregate is one reduceat call
+    and its cost does not depend on the number of DBs.
+    """
+
+    def __init__(
+        self, dbs: Sequence[str], db_ids: np.ndarray, si: np.ndarray, cf: np.ndarray
+    ) -> None:
+        """
+        Calculates aggregates
+        :param dbs: names of the DBs
+        :param db_ids: index of the DB in dbs for every image
+        :param si: raw SI of every image
+        :param cf: raw CF of every image
+        """
+        db_ids = np.asarray(db_ids)
+        if not len(db_ids) == len(si) == len(cf):
+            raise DatabaseAggregateError("Arrays of DB ids, SI and CF differ in length")
+        self.dbs = list(dbs)
+        self.images = np.bincount(db_ids, minlength=len(self.dbs))
+        if (self.images == 0).any():
+            empty = [db for db, n in zip(self.dbs, self.images) if n == 0]
+            raise DatabaseAggregateError(f"DBs without images: {empty}")
+
+        order = np.argsort(db_ids, kind="stable")
+        values = np.vstack((si, cf)).astype(float)[:, order]
+        starts = np.concatenate(([0], np.cumsum(self.images)[:-1]))
+        self.minimum = np.minimum.reduceat(values, starts, axis=1)
+        self.maximum = np.maximum.reduceat(values, starts, axis=1)
+        # Entropy sums of all DBs laid out like DatabaseSummary.entropy_sums with trailing DB axis
+        self.entropy_sums = np.stack(
+            (
+                np.add.reduceat(values, starts, axis=1),
+                np.add.reduceat(weighted_logs(values), starts, axis=1),
+            ),
+            axis=1,
+        )
+
+    @classmethod
+    def from_si_cf(
+        cls, dbs: Sequence[str], si_cf: Dict[str, Tuple[List[float], List[float]]]
+    ) -> "DatabaseAggregate":
+        """
+        Calculates aggregates from per DB lists of raw SI and CF
+        :param dbs: names of the DBs
+        :param si_cf: DB to (SI, CF) lists mapping
+        :return: aggregates of the DBs
+        """
+        counts = [len(si_cf[db][0]) for db in dbs]
+        db_ids = np.repeat(np.arange(len(counts)), counts)
+        si = np.fromiter((v for db in dbs for v in si_cf[db][0]), float, sum(counts))
+        cf = np.fromiter((v for db in dbs for v in si_cf[db][1]), float, sum(counts))
+        return cls(dbs, db_ids, si, cf)
+
+    @classmethod
+    def from_summaries(
+        cls, dbs: Sequence[str], summaries: Dict[str, DatabaseSummary]
+    ) -> "DatabaseAggregate":
+        """
+        Collects aggregates from per DB summaries, no per image values are needed
+        :param dbs: names of the DBs
+        :param summaries: DB to summary mapping
+        :return: aggregates of the DBs
+        """
+        aggregate = cls.__new__(cls)
+        aggregate.dbs = list(dbs)
+        selected = [summaries[db] for db in aggregate.dbs]
+        aggregate.images = np.array([s.images for s in selected])
+        aggregate.minimum = np.array(
+            [[s.si_min for s in selected], [s.cf_min for s in selected]]
+        )
+        aggregate.maximum = np.array(
+            [[s.si_max for s in selected], [s.cf_max for s in selected]]
+        )
+        aggregate.entropy_sums = np.stack([s.entropy_sums for s in selected], axis=-1)
+        return aggregate
+
+    def get_max_si_cf(self) -> Tuple[float, float]:
+        """
+        Returns maximum value of Spatial Information and Colorfulness across all DBs
+        :return: Tuple (max_si, max_cf)
+        """
+        max_si, max_cf = self.maximum.max(axis=1)
+        return float(max_si), float(max_cf)
+
+    def get_si_cf_ranges(
+        self, max_si_cf: Tuple[float, float]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates SI and CF relative ranges of all DBs
+        :param max_si_cf: Maximum values of SI and CF across all analyzed databases
+        :return: Tuple of (SI, CF) arrays of relative ranges in order of dbs
+        """
+        ranges = (self.maximum - self.minimum) / np.array(max_si_cf)[:, np.newaxis]
+        return ranges[0], ranges[1]
+
+    def get_si_cf_uniformity(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates SI and CF uniformity of all DBs as base 10 entropy of SI and CF distributions
+        :return: Tuple of (SI, CF) arrays of uniformity in order of dbs
+        """
+        return uniformity(self.entropy_sums)
@@ -2,16 +2,39 @@
 import logging
 import os
 from enum import Enum
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-import seaborn as sns
+from app.database_aggregate import DatabaseAggregate
 from app.database_collection import DatabaseCollection
-from app.database_metrics import DatabaseMetrics, DatabaseMetricsError
-from matplotlib import pyplot as plt
-from matplotlib import rc
-from scipy.stats import entropy
+from app.database_metrics import (
+    DatabaseMetrics,
+    DatabaseMetricsError,
+    list_images,
+)
+from app.database_shard import read_summaries, write_summaries
+from app.database_summary import DatabaseSummary, DatabaseSummaryError
+from app.grid_density import GridDensityError
+from app.image_dedup import (
+    NEAR_DUPLICATE_DISTANCE,
+    ImageDedupError,
+    near_duplicates,
+    perceptual_hashes,
+)
+from app.image_metrics import read_image_size
+from app.image_metrics_pool import ImageMetricsPool, ImageRecord
+from app.instrumentation import recorder
+from app.metrics_cache import MetricsCache, MetricsCacheError
+from app.metrics_store import (
+    DATABASES_TABLE,
+    IMAGE_COLUMNS,
+    IMAGES_TABLE,
+    SUMMARY_TABLE,
+    MetricsStore,
+    MetricsStoreError,
+)
+from app.plot_render import PlotJob, render_all
 
 FIG_SIZE = (int(os.getenv("BAR_XSIZE", 10)), int(os.getenv("BAR_YSIZE", 6)))
 
@@ -23,6 +46,10 @@ class SingleMetrics(Enum):
 
     AREA = "Area"
     FILL_RATE = "Fill rate"
+    NN_COVERAGE = "Nearest neighbour coverage"
+    GRID_OCCUPANCY = "Grid occupancy"
+    JOINT_UNIFORMITY = "Joint uniformity"
+    KDE_COVERAGE = "KDE coverage"
     DIST_IMG = "Distorted images"
     DIST_TYPES = "Distortion types"
     DIST_LVLS = "Distortion levels"
@@ -49,12 +76,51 @@ class DatabaseAnalyze:
     Analyze set of databases
     """
 
-    def __init__(self, parent_dir: str, output: Optional[str] = None):
+    def __init__(
+        self,
+        parent_dir: str,
+        output: Optional[str] = None,
+        workers: int = 1,
+        cache: bool = False,
+        cache_dir: Optional[str] = None,
+        plots: bool = True,
+        decode_scale: int = 1,
+        store: Optional[str] = None,
+        from_store: bool = False,
+        summary_only: bool = False,
+    ):
+        """
+        DatabaseAnalyze constructor
+        :param parent_dir: parent directory of all analyzed DBs
+        :param output: directory in which output images should be saved
+        :param workers: number of processes calculating image metrics and rendering plots, 0 means all cores
+        :param cache: whether SI and CF should be kept in persistent per DB cache
+        :param cache_dir: directory for cache files, each DB directory is used if not given
+        :param plots: whether plots should be rendered, only metrics are calculated otherwise
+        :param decode_scale: maximal reduction factor of decoded images for fast triage, 1 means full resolution
+        :param store: directory of columnar store, per image and per DB results are written there when given
+        :param from_store: whether per image results should be loaded from store instead of processing images
+        :param summary_only: whether only maxima, area, ranges and uniformity should be analyzed from DB summaries
+            in the store, per image results are not loaded then
+        """
         logging.debug(
             f"DatabaseAnalyze init for dir: '{parent_dir}' and output: '{output}'"
         )
         self.parent_dir = parent_dir
         self.output = output
+        self.workers = workers
+        self.decode_scale = decode_scale
+        # Stored image table holds processing times, so they are measured even without instrumentation
+        self.pool = ImageMetricsPool(workers, decode_scale, timed=store is not None)
+        self.plots = plots
+        self.plot_jobs: List[PlotJob] = list()
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.store = store
+        self.from_store = from_store or summary_only
+        self.summary_only = summary_only
+        if self.from_store and store is None:
+            raise DatabaseAnalyzeError("Loading results requires store directory")
 
         self.max_si = 0.0
         self.max_cf = 0.0
@@ -66,6 +132,9 @@ class DatabaseAnalyze:
         self.dc = DatabaseCollection(self.parent_dir)
 
         self.db_metric: Dict[str, DatabaseMetrics] = dict()
+        self.raw_si_cf: Dict[str, Tuple[List[float], List[float]]] = dict()
+        self.summaries: Dict[str, DatabaseSummary] = dict()
+        self.images: Dict[str, List[str]] = dict()
 
         self.df_single = pd.DataFrame(
             columns=[v.value for v in SingleMetrics], index=self.dc.directories
@@ -78,43 +147,336 @@ class DatabaseAnalyze:
                 np.array(["SI"] * len(self.dc) + ["CF"] * len(self.dc)),
             ],
         )
-        self.__create_palette()
         self.__get_max_si_cf()
         logging.debug(f"Max SI: '{self.max_si}', Max CF: '{self.max_cf}'")
 
-        sns.set(style="white")
-        rc("font", **{"size": 36, "family": "serif", "serif": ["Computer Modern"]})
-        rc("text", usetex=True)
-
     def __get_max_si_cf(self) -> None:
         """
-        Iterates over all databases and calculate max SI and CF across all DBs
+        Gets raw SI and CF of every image of all databases, aggregates them
+        and finds max SI and CF across all DBs
+        """
+        if self.from_store:
+            self.__load_summaries()
+            if not self.summary_only:
+                self.__load_store()
+        else:
+            self.__calculate_si_cf()
+
+        if self.summaries:
+            self.aggregate = DatabaseAggregate.from_summaries(
+                self.dc.directories, self.summaries
+            )
+        else:
+            self.aggregate = DatabaseAggregate.from_si_cf(
+                self.dc.directories, self.raw_si_cf
+            )
+        self.max_si, self.max_cf = self.aggregate.get_max_si_cf()
+
+    def __calculate_si_cf(self) -> None:
+        """
+        Calculates raw SI and CF once for every image of all databases, cached values are reused
         """
         for db in self.dc:
-            db_metric = DatabaseMetrics(
-                self.parent_dir + db, self.output, (1.0, 1.0), db
+            with recorder.stage("scan", db) as stage:
+                self.images[db] = list_images(self.parent_dir + db)
+                stage.items = len(self.images[db])
+        images = self.images
+        results = {db: self.__read_cache(db, images[db]) for db in self.dc}
+        records: Dict[str, List[Optional[ImageRecord]]] = {
+            db: [None] * len(images[db]) for db in self.dc
+        }
+        missing = [
+            (db, i) for db in self.dc for i, r in enumerate(results[db]) if r is None
+        ]
+        logging.debug(f"Calculating metrics for {len(missing)} images")
+        calculated = self.pool.calculate_records([images[db][i] for db, i in missing])
+        for (db, i), record in zip(missing, calculated):
+            results[db][i] = (record.si, record.cf)
+            records[db][i] = record
+            recorder.add("decode", db, record.decode_seconds, record.decode_cpu_seconds)
+            recorder.add(
+                "si_cf",
+                db,
+                record.seconds - record.decode_seconds,
+                record.cpu_seconds - record.decode_cpu_seconds,
             )
-            si, cf = db_metric.get_max_si_cf()
-            self.max_si = si if si > self.max_si else self.max_si
-            self.max_cf = cf if cf > self.max_cf else self.max_cf
 
-    def analyze(self) -> None:
+        for db in self.dc:
+            self.__write_cache(
+                db, images[db], results[db], [i for m, i in missing if m == db]
+            )
+            self.raw_si_cf[db] = (
+                [r[0] for r in results[db] if r is not None],
+                [r[1] for r in results[db] if r is not None],
+            )
+        self.__write_image_table(records)
+
+    def __write_image_table(
+        self, records: Dict[str, List[Optional[ImageRecord]]]
+    ) -> None:
         """
-        Main entrypoint for performing analysis
+        Writes per image results to columnar store
+        Images whose values came from cache have size read from their header and unknown processing time.
+        :param records: records of calculated images, None for cached images
         """
+        if self.store is None:
+            return
+        dbs: List[str] = list()
+        files: List[str] = list()
+        rows: List[ImageRecord] = list()
         for db in self.dc:
-            self.db_metric[db] = DatabaseMetrics(
-                self.parent_dir + db, self.output, (self.max_si, self.max_cf), db
+            for image, si, cf, record in zip(
+                self.images[db], *self.raw_si_cf[db], records[db]
+            ):
+                if record is None:
+                    height, width = read_image_size(image) or (0, 0)
+                    nan = float("nan")
+                    record = ImageRecord(si, cf, height, width, nan, nan, nan, nan)
+                dbs.append(db)
+                files.append(os.path.relpath(image, self.parent_dir + db))
+                rows.append(record)
+        columns = {
+            "db": np.array(dbs, dtype=str),
+            "file": np.array(files, dtype=str),
+        }
+        for field in ImageRecord._fields:
+            columns[field] = np.array([getattr(row, field) for row in rows])
+        try:
+            ms = MetricsStore(self.store)
+            ms.write_table(IMAGES_TABLE, columns)
+            write_summaries(
+                ms, {db: DatabaseSummary(*self.raw_si_cf[db]) for db in self.dc}
             )
-            self.db_metric[db].plot_all()
+        except MetricsStoreError as err:
+            raise DatabaseAnalyzeError(str(err))
 
-        self.__parse_info()
-        self.__fill_rate_factor()
+    def __load_summaries(self) -> None:
+        """
+        Loads DB summaries written with per image results, stores written without them are loaded from points
+        """
+        ms = MetricsStore(self.store)
+        if not ms.exists(SUMMARY_TABLE):
+            if self.summary_only:
+                raise DatabaseAnalyzeError(
+                    f"DB summaries are missing in store '{self.store}'"
+                )
+            return
+        try:
+            summaries = read_summaries(ms)
+        except (MetricsStoreError, DatabaseSummaryError) as err:
+            raise DatabaseAnalyzeError(str(err))
+        missing = [db for db in self.dc if db not in summaries]
+        if missing:
+            raise DatabaseAnalyzeError(
+                f"DBs {missing} are missing in summaries of store '{self.store}'"
+            )
+        self.summaries = {db: summaries[db] for db in self.dc}
+
+    def __load_store(self) -> None:
+        """
+        Loads raw SI and CF of all images from columnar store, so no image is read
+        """
+        try:
+            table = MetricsStore(self.store).read_table(
+                IMAGES_TABLE, required=IMAGE_COLUMNS
+            )
+        except MetricsStoreError as err:
+            raise DatabaseAnalyzeError(str(err))
+        dbs = np.asarray(table["db"])
+        for db in self.dc:
+            mask = dbs == db
+            if not mask.any():
+                raise DatabaseAnalyzeError(
+                    f"DB '{db}' is missing in store '{self.store}'"
+                )
+            self.images[db] = [
+                f"{self.parent_dir}{db}/{file}" for file in table["file"][mask]
+            ]
+            self.raw_si_cf[db] = (
+                table["si"][mask].tolist(),
+                table["cf"][mask].tolist(),
+            )
+
+    def __read_cache(
+        self, db: str, images: List[str]
+    ) -> List[Optional[Tuple[float, float]]]:
+        """
+        Gets SI and CF of DB images from persistent cache
+        :param db: database
+        :param images: paths to all images of the DB
+        :return: cached SI and CF, None for images which have to be calculated
+        """
+        if not self.cache:
+            return [None] * len(images)
+        try:
+            with MetricsCache(
+                self.parent_dir + db, self.cache_dir, decode_scale=self.decode_scale
+            ) as cache:
+                return cache.get_many(images)
+        except MetricsCacheError as err:
+            raise DatabaseAnalyzeError(str(err))
+
+    def __write_cache(
+        self,
+        db: str,
+        images: List[str],
+        results: List[Optional[Tuple[float, float]]],
+        calculated: List[int],
+    ) -> None:
+        """
+        Stores newly calculated SI and CF in persistent cache and evicts removed images
+        :param db: database
+        :param images: paths to all images of the DB
+        :param results: SI and CF of all images of the DB
+        :param calculated: indices of images which were calculated in this run
+        """
+        if not self.cache:
+            return
+        try:
+            with MetricsCache(
+                self.parent_dir + db, self.cache_dir, decode_scale=self.decode_scale
+            ) as cache:
+                cache.put_many(
+                    [images[i] for i in calculated],
+                    [results[i] for i in calculated],
+                )
+                cache.prune(images)
+        except MetricsCacheError as err:
+            raise DatabaseAnalyzeError(str(err))
+
+    def decode_error(self) -> pd.DataFrame:
+        """
+        Compares SI and CF calculated from reduced decode with full resolution values
+        :return: dataframe with mean absolute and mean relative errors of SI and CF for each DB
+        """
+        if self.decode_scale == 1:
+            raise DatabaseAnalyzeError("Decode error requires reduced decode scale")
+        self.__require_images()
+        full_pool = ImageMetricsPool(self.pool.workers, 1)
+        images = [image for db in self.dc for image in self.images[db]]
+        full = iter(full_pool.calculate_si_cf(images))
+
+        df = pd.DataFrame(
+            columns=["SI MAE", "CF MAE", "SI relative error", "CF relative error"],
+            index=self.dc.directories,
+        )
+        for db in self.dc:
+            reduced = np.array(self.raw_si_cf[db]).T
+            reference = np.array([next(full) for _ in self.images[db]])
+            error = np.abs(reduced - reference)
+            relative = error / np.where(reference > 0, reference, 1.0)
+            df.loc[db] = np.concatenate((error.mean(axis=0), relative.mean(axis=0)))
+        return df
+
+    def near_duplicates(
+        self, max_distance: int = NEAR_DUPLICATE_DISTANCE
+    ) -> pd.DataFrame:
+        """
+        Finds near-duplicate images in different DBs by Hamming distance of their perceptual hashes
+        Byte-identical copies have distance 0, such overlap between DBs inflates their coverage.
+        :param max_distance: maximal Hamming distance of 64 bit hashes of near-duplicates
+        :return: dataframe with DB and image of both duplicates and their distance
+        """
+        self.__require_images()
+        dbs = [db for db in self.dc for _ in self.images[db]]
+        images = [image for db in self.dc for image in self.images[db]]
+        try:
+            hashes = perceptual_hashes(images, self.pool.workers)
+        except ImageDedupError as err:
+            raise DatabaseAnalyzeError(str(err))
+        pairs = near_duplicates(hashes, np.array(dbs), max_distance)
+        return pd.DataFrame(
+            [
+                (
+                    dbs[i],
+                    os.path.relpath(images[i], self.parent_dir + dbs[i]),
+                    dbs[j],
+                    os.path.relpath(images[j], self.parent_dir + dbs[j]),
+                    distance,
+                )
+                for i, j, distance in pairs
+            ],
+            columns=["DB", "Image", "Other DB", "Other image", "Distance"],
+        )
+
+    def __require_images(self) -> None:
+        """
+        Checks that per image results are available
+        """
+        if self.summary_only:
+            raise DatabaseAnalyzeError(
+                "Per image results are not loaded in summary only analysis"
+            )
+
+    def analyze(self) -> None:
+        """
+        Main entrypoint for performing analysis
+        Summary only analysis calculates just metrics available from DB summaries (uniformity,
+        relative ranges and area), so its memory does not depend on the number of images.
+        """
+        self.plot_jobs = list()
+        if not self.summary_only:
+            self.__analyze_points()
         self.__uniformity()
         self.__relative_ranges()
         self.__convex_hull_area()
+        if not self.summary_only:
+            self.__nn_coverage()
+            self.__grid_density()
+
+        self.__write_database_table()
+
+        rendered = render_all(self.plot_jobs, self.workers)
+        logging.debug(f"Rendered {rendered} of {len(self.plot_jobs)} plots")
+
+    def __analyze_points(self) -> None:
+        """
+        Creates metrics of all DBs from their points and calculates info and fill rate
+        """
+        for db in self.dc:
+            with recorder.stage("hull", db, len(self.raw_si_cf[db][0])):
+                self.db_metric[db] = DatabaseMetrics(
+                    self.parent_dir + db,
+                    self.output,
+                    (self.max_si, self.max_cf),
+                    db,
+                    self.raw_si_cf[db],
+                    self.images[db],
+                )
+            if self.plots:
+                self.plot_jobs += self.db_metric[db].plot_jobs()
+
+        self.__parse_info()
+        self.__fill_rate_factor()
+
+    def __write_database_table(self) -> None:
+        """
+        Writes per DB metrics to columnar store, metrics with SI/CF split are stored as two columns
+        """
+        if self.store is None:
+            return
+        columns = {"db": np.array(self.dc.directories, dtype=str)}
+        for single in SingleMetrics:
+            if single is not SingleMetrics.PALETTE:
+                values = pd.to_numeric(self.df_single[single.value], errors="coerce")
+                columns[single.value] = values.to_numpy(dtype=float)
+        for double in DoubleMetrics:
+            for split in ("SI", "CF"):
+                values = self.df_double[double.value].xs(split, level=1)
+                columns[f"{double.value} {split}"] = values.reindex(
+                    self.dc.directories
+                ).to_numpy(dtype=float)
+        try:
+            MetricsStore(self.store).write_table(DATABASES_TABLE, columns)
+        except MetricsStoreError as err:
+            raise DatabaseAnalyzeError(str(err))
 
     def __create_palette(self):
+        """
+        Assigns colors to DBs, called before the first bar plot, so runs without plots do not import seaborn
+        """
+        import seaborn as sns
+
         palette = sns.color_palette("deep", len(self.dc))
         for p, db in zip(palette, self.dc):
             self.df_single.at[db, SingleMetrics.PALETTE.value] = p
@@ -152,68 +514,124 @@ class DatabaseAnalyze:
 
     def __relative_ranges(self) -> None:
         """
-        Calculates relative ranges
+        Calculates relative ranges of all DBs at once
         """
-        for db in self.dc:
-            si_rr, cf_rr = self.db_metric[db].get_si_cf_ranges()
-            self.df_double.at[(db, "SI"), DoubleMetrics.RELATIVE_RANGES.value] = si_rr
-            self.df_double.at[(db, "CF"), DoubleMetrics.RELATIVE_RANGES.value] = cf_rr
+        si_rr, cf_rr = self.aggregate.get_si_cf_ranges((self.max_si, self.max_cf))
+        self.df_double[DoubleMetrics.RELATIVE_RANGES.value] = np.concatenate(
+            (si_rr, cf_rr)
+        )
         self.__double_bar(DoubleMetrics.RELATIVE_RANGES.value)
 
     def __convex_hull_area(self) -> None:
         """
-        Calculates convex hull area
+        Calculates convex hull area from hull vertices in DB summaries if loaded, from DB hulls otherwise
         """
-        for db in self.dc:
-            area = self.db_metric[db].get_coverage_area()
-            self.df_single.at[db, SingleMetrics.AREA.value] = area
+        max_si_cf = (self.max_si, self.max_cf)
+        self.df_single[SingleMetrics.AREA.value] = [
+            (
+                self.summaries[db].get_coverage_area(max_si_cf)
+                if self.summaries
+                else self.db_metric[db].get_coverage_area()
+            )
+            for db in self.dc
+        ]
         self.__single_bar(SingleMetrics.AREA.value)
 
+    def __nn_coverage(self) -> None:
+        """
+        Calculates nearest neighbour coverage based on spatial index
+        """
+        self.df_single[SingleMetrics.NN_COVERAGE.value] = [
+            self.db_metric[db].get_nn_coverage() for db in self.dc
+        ]
+        self.__single_bar(SingleMetrics.NN_COVERAGE.value)
+
+    def __grid_density(self) -> None:
+        """
+        Calculates grid occupancy, joint uniformity and KDE coverage from 2-D histograms of normalized points
+        """
+        metrics = {
+            SingleMetrics.GRID_OCCUPANCY: DatabaseMetrics.get_grid_occupancy,
+            SingleMetrics.JOINT_UNIFORMITY: DatabaseMetrics.get_joint_uniformity,
+            SingleMetrics.KDE_COVERAGE: DatabaseMetrics.get_kde_coverage,
+        }
+        for metric, method in metrics.items():
+            try:
+                self.df_single[metric.value] = [
+                    method(self.db_metric[db]) for db in self.dc
+                ]
+            except GridDensityError as err:
+                raise DatabaseAnalyzeError(str(err))
+            self.__single_bar(metric.value)
+
     def __fill_rate_factor(self) -> None:
         """
         Calculates fill rate factor based on fixed radius approach
         """
+        fill_rates = list()
         for db in self.dc:
-            fill_rate = self.db_metric[db].calculate_fill_rate_fixed_radius_area()
-            self.df_single.at[db, SingleMetrics.FILL_RATE.value] = fill_rate
+            with recorder.stage("fill_rate", db):
+                fill_rates.append(
+                    self.db_metric[db].calculate_fill_rate_fixed_radius_area()
+                )
+        self.df_single[SingleMetrics.FILL_RATE.value] = fill_rates
         self.__single_bar(SingleMetrics.FILL_RATE.value)
 
     def __uniformity(self) -> None:
         """
-        Calculates uniformity for databases
+        Calculates uniformity of all DBs at once
         """
-        for db in self.dc:
-            si_uni = entropy(self.db_metric[db].si, base=10)
-            cf_uni = entropy(self.db_metric[db].cf, base=10)
-            self.df_double.at[(db, "SI"), DoubleMetrics.UNIFORMITY.value] = si_uni
-            self.df_double.at[(db, "CF"), DoubleMetrics.UNIFORMITY.value] = cf_uni
+        si_uni, cf_uni = self.aggregate.get_si_cf_uniformity()
+        self.df_double[DoubleMetrics.UNIFORMITY.value] = np.concatenate(
+            (si_uni, cf_uni)
+        )
         self.__double_bar(DoubleMetrics.UNIFORMITY.value)
 
     def __single_bar(self, y, unit_scale: bool = True):
         """
-        Plots bar for given metric
+        Describes bar plot for given metric
         :param y: metric
         """
-        fig, ax = plt.subplots(figsize=FIG_SIZE)
+        if self.output is None or not self.plots:
+            return
+        if self.df_single[SingleMetrics.PALETTE.value].isna().any():
+            self.__create_palette()
         df = self.df_single.sort_values(by=y, ascending=False)
-        ax = sns.barplot(
-            x=df.index, y=y, data=df, palette=df[SingleMetrics.PALETTE.value], ax=ax
+        data = dict(
+            labels=list(df.index),
+            values=[float(v) for v in df[y]],
+            palette=list(df[SingleMetrics.PALETTE.value]),
         )
+        axes: Dict[str, Any] = dict(ylabel=None, title=y)
         if unit_scale:
-            ax.set(ylim=[0, 1])
-        ax.set(ylabel=None, title=y)
-        if self.output is not None:
-            fig.savefig(self.output + f"bar_{y.lower().replace(' ', '_')}.png")
+            axes["ylim"] = [0, 1]
+        self.__add_bar_job(y, "single_bar", data, axes)
 
     def __double_bar(self, y):
         """
-        Plots double bar for given metric with SI/CF split
+        Describes double bar plot for given metric with SI/CF split
         :param y: metric
         """
-        fig, ax = plt.subplots(figsize=FIG_SIZE)
         df = self.df_double.sort_values(by=y, ascending=False).reset_index()
-        df = df.rename(columns={"level_0": "DB", "level_1": "Metric"})
-        ax = sns.barplot(x="DB", y=y, hue="Metric", data=df, ax=ax)
-        ax.set(ylim=(0, 1), ylabel=None, title=y)
-        if self.output is not None:
-            fig.savefig(self.output + f"bar_{y.lower().replace(' ', '_')}.png")
+        data = dict(
+            labels=list(df["level_0"]),
+            metrics=list(df["level_1"]),
+            values=[float(v) for v in df[y]],
+        )
+        axes = dict(ylim=(0, 1), ylabel=None, title=y)
+        self.__add_bar_job(y, "double_bar", data, axes)
+
+    def __add_bar_job(
+        self, y: str, kind: str, data: Dict[str, Any], axes: Dict[str, Any]
+    ) -> None:
+        """
+        Adds bar plot to the plots rendered at the end of analysis
+        :param y: metric
+        :param kind: kind of the bar plot
+        :param data: plotted data
+        :param axes: axes properties
+        """
+        if self.output is None or not self.plots:
+            return
+        filename = self.output + f"bar_{y.lower().replace(' ', '_')}.png"
+        self.plot_jobs.append(PlotJob(filename, kind, data, FIG_SIZE, axes))
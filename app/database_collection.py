@@ -1,7 +1,7 @@
 """Tools for handling multiple DBs"""
 
-from os import listdir
-from os.path import isdir, join
+import os
+from os.path import isdir
 from typing import List
 
 
@@ -48,7 +48,8 @@ class DatabaseCollection:
             raise DatabaseIteratorInputError(
                 f"Provided path is not directory '{directory}'"
             )
-        self.dirs = [f for f in listdir(directory) if isdir(join(directory, f))]
+        with os.scandir(directory) as it:
+            self.dirs = sorted(entry.name for entry in it if entry.is_dir())
         if not len(self.dirs):
             raise DatabaseIteratorInputError(
                 f"Provided path does not contain directories '{directory}'"
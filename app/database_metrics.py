@@ -4,63 +4,63 @@ import os
 from typing import Dict, List, Optional, Tuple
 
 import numpy as np
-import seaborn as sns
 import yaml
+from app.database_summary import entropy_sums, uniformity
+from app.fill_rate import FillRateBackend, fill_rate_geometric
+from app.grid_density import GRID_RESOLUTION, GridDensity
 from app.image_collection import ImageCollection, ImageIteratorInputError
-from app.image_metrics import ImageMetrics
-from matplotlib import pyplot as plt
-from matplotlib import rc, rcParams
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-from matplotlib.patches import Polygon
-from scipy.spatial import ConvexHull, Delaunay
+from app.image_metrics import ImageMetricsInputError
+from app.image_metrics_pool import ImageMetricsPool
+from app.plot_render import PlotJob, plot_rc, render_all
+from app.spatial_index import COVERAGE_RADIUS, SpatialIndex
+from scipy.spatial import ConvexHull, QhullError
 
 FIG_SIZE = (int(os.getenv("FIGURE_XSIZE", 6)), int(os.getenv("FIGURE_YSIZE", 6)))
 XLIM = int(os.getenv("FIGURE_XLIM", 165))
 YLIM = int(os.getenv("FIGURE_YLIM", 170))
+FILL_RATE_BACKEND = FillRateBackend(os.getenv("FILL_RATE_BACKEND", "raster"))
 
 
 class DatabaseMetricsError(Exception):
     """Generic database metrics error"""
 
 
-def describe_figure(filename, xlabel: str, ylabel: str, title: str = None):
-    """Handles common figure processiflang for different plots: labels, limits, titles, etc"""
+def list_images(directory: str) -> List[str]:
+    """
+    Lists all images in the DB
+    :param directory: path to the DB
+    :return: list of paths to the images
+    """
+    try:
+        return list(ImageCollection(directory))
+    except ImageIteratorInputError as err:
+        raise DatabaseMetricsError(f"Error during creating ImageCollection '{err}'")
 
-    def decorator(func):
-        def wrapper(obj):
-            fig, ax = plt.subplots(figsize=FIG_SIZE)
-            func(obj, ax)
-            if obj.output_dir is not None:
-                ax_title = title if title is not None else obj.label
-                ax.set(
-                    xlim=[0, XLIM],
-                    ylim=[0, YLIM],
-                    xlabel=xlabel,
-                    ylabel=ylabel,
-                    title=ax_title,
-                )
-                plt.tight_layout()
-                plt.savefig(
-                    f"{obj.output_dir}{obj.label}_{filename}", bbox_inches="tight"
-                )
-            plt.close(fig)
 
-        return wrapper
-
-    return decorator
+def calculate_raw_si_cf(images: List[str]) -> Tuple[List[float], List[float]]:
+    """
+    Creates lists of raw (not normalized) SI and CF for each image
+    :param images: paths to the images
+    :return: Tuple of (SI, CF) lists
+    """
+    try:
+        si_cf = ImageMetricsPool().calculate_si_cf(images)
+    except ImageMetricsInputError as err:
+        raise DatabaseMetricsError(str(err))
+    return [si for si, _ in si_cf], [cf for _, cf in si_cf]
 
 
 class DatabaseMetrics:
     """Class for calculating various metrics for single DB"""
 
-    PRECISION = 40
-
     def __init__(
         self,
         directory: str,
         output_dir: Optional[str],
         max_si_cf: Tuple[float, float],
         label: str = "",
+        si_cf: Optional[Tuple[List[float], List[float]]] = None,
+        images: Optional[List[str]] = None,
     ) -> None:
         """
         DatabaseMetrics constructor
@@ -68,26 +68,139 @@ class DatabaseMetrics:
         :param output_dir: directory in which output images should be saved
         :param max_si_cf: Maximum values of SI and CF across all analyzed databases
         :param label: DB label used in plot titles
+        :param si_cf: already computed raw (SI, CF) lists, images are not processed when given
+        :param images: paths to the images corresponding to si_cf, needed for removing images later
         """
-        try:
-            self.it = ImageCollection(directory)
-        except ImageIteratorInputError as err:
-            raise DatabaseMetricsError(f"Error during creating ImageCollection '{err}'")
+        if si_cf is None:
+            images = list_images(directory)
+            si_cf = calculate_raw_si_cf(images)
         self.directory = directory
         self.output_dir = output_dir
         self.label = label
-        self.si: List[float] = list()
-        self.cf: List[float] = list()
-        self.norm_si: List[float] = list()
-        self.norm_cf: List[float] = list()
+        self.si: List[float] = list(si_cf[0])
+        self.cf: List[float] = list(si_cf[1])
+        self.images: List[str] = (
+            list(images) if images is not None else [""] * len(self.si)
+        )
+        self.entropy_sums = entropy_sums(self.si, self.cf)
+        self.points = np.vstack((self.cf, self.si)).T
+        self.hull = self.__convex_hull(self.points)
+        self.normalize(max_si_cf)
+
+    def normalize(self, max_si_cf: Tuple[float, float]) -> None:
+        """
+        Normalizes raw SI and CF against global maxima, no image is processed again
+        :param max_si_cf: Maximum values of SI and CF across all analyzed databases
+        """
         self.max_db_si, self.max_db_cf = max_si_cf
-        self.points, self.norm_points = self.__calculate_si_cf()
-        self.hull = ConvexHull(self.points)
-        self.norm_hull = ConvexHull(self.norm_points)
+        self.norm_si: List[float] = [si / self.max_db_si for si in self.si]
+        self.norm_cf: List[float] = [cf / self.max_db_cf for cf in self.cf]
+        self.norm_points = np.vstack((self.norm_cf, self.norm_si)).T
+        self.norm_hull = self.__convex_hull(self.norm_points)
+        self.__index: Optional[SpatialIndex] = None
+        self.__grid: Optional[GridDensity] = None
+
+    @property
+    def index(self) -> SpatialIndex:
+        """
+        Spatial index of normalized points, built on first query after the points changed
+        :return: spatial index
+        """
+        if self.__index is None:
+            self.__index = SpatialIndex(self.norm_points)
+        return self.__index
+
+    @property
+    def grid(self) -> GridDensity:
+        """
+        Grid density of normalized points, built on first query after the points changed
+        :return: grid density
+        """
+        if self.__grid is None:
+            self.__grid = GridDensity(self.norm_points)
+        return self.__grid
+
+    def add_images(
+        self,
+        images: List[str],
+        si_cf: Optional[Tuple[List[float], List[float]]] = None,
+    ) -> None:
+        """
+        Adds images to the DB, only the new images are processed.
+        Convex hulls are extended incrementally, global maxima used for normalization stay unchanged.
+        :param images: paths to the new images
+        :param si_cf: already computed raw (SI, CF) lists of new images
+        """
+        if si_cf is None:
+            si_cf = calculate_raw_si_cf(images)
+        si, cf = list(si_cf[0]), list(si_cf[1])
+        if not len(images) == len(si) == len(cf):
+            raise DatabaseMetricsError(
+                f"Number of images {len(images)} does not match number of SI {len(si)} and CF {len(cf)} values"
+            )
+        if not len(si):
+            return
+        points = np.vstack((cf, si)).T
+        norm_points = points / (self.max_db_cf, self.max_db_si)
+
+        self.images += images
+        self.si += si
+        self.cf += cf
+        self.norm_si += list(norm_points[:, 1])
+        self.norm_cf += list(norm_points[:, 0])
+        self.entropy_sums += entropy_sums(si, cf)
+        self.points = np.vstack((self.points, points))
+        self.norm_points = np.vstack((self.norm_points, norm_points))
+        try:
+            self.hull.add_points(points)
+            self.norm_hull.add_points(norm_points)
+        except QhullError as err:
+            raise DatabaseMetricsError(f"Convex hull could not be extended: {err}")
+        self.__index = None
+        self.__grid = None
+
+    def remove_images(self, images: List[str]) -> None:
+        """
+        Removes images from the DB, remaining images are not processed again
+        :param images: paths to the removed images
+        """
+        if "" in images:
+            raise DatabaseMetricsError(
+                "Images can be removed only by non-empty path, images added without paths can not be removed"
+            )
+        removed = set(images)
+        keep = [i for i, image in enumerate(self.images) if image not in removed]
+        dropped = [i for i, image in enumerate(self.images) if image in removed]
+        if not dropped:
+            return
+        self.entropy_sums -= entropy_sums(
+            [self.si[i] for i in dropped], [self.cf[i] for i in dropped]
+        )
+        self.images = [self.images[i] for i in keep]
+        self.si = [self.si[i] for i in keep]
+        self.cf = [self.cf[i] for i in keep]
+        self.points = self.points[keep]
+        self.hull = self.__convex_hull(self.points)
+        self.normalize((self.max_db_si, self.max_db_cf))
 
-        sns.set(style="white")
-        rc("font", **{"size": 36, "family": "serif", "serif": ["Computer Modern"]})
-        rc("text", usetex=True)
+    @staticmethod
+    def __convex_hull(points: np.ndarray) -> ConvexHull:
+        """
+        Creates convex hull which can be extended with new points
+        :param points: array of points
+        :return: incremental convex hull
+        """
+        try:
+            return ConvexHull(points, incremental=True)
+        except QhullError as err:
+            raise DatabaseMetricsError(f"Convex hull could not be created: {err}")
+
+    def get_si_cf_uniformity(self) -> Tuple[float, float]:
+        """
+        Calculates SI and CF uniformity as base 10 entropy of SI and CF distributions
+        :return: Tuple of (SI, CF) uniformity
+        """
+        return uniformity(self.entropy_sums)
 
     def get_max_si_cf(self) -> Tuple[float, float]:
         """
@@ -124,14 +237,96 @@ class DatabaseMetrics:
         """
         return math.sqrt(self.norm_hull.volume)
 
-    def plot_all(self) -> None:
+    def get_nn_coverage(self, radius: float = COVERAGE_RADIUS) -> float:
+        """
+        Calculates fraction of normalized SIxCF plane which has an image closer than radius
+        :param radius: coverage radius in normalized units
+        :return: nearest neighbour coverage [0-1]
+        """
+        return self.index.nn_coverage(radius)
+
+    def get_union_area(self, radius: float = COVERAGE_RADIUS) -> float:
+        """
+        Calculates area of union of circles of given radius around images in normalized SIxCF plane
+        :param radius: circle radius in normalized units
+        :return: union area
+        """
+        return self.index.union_area(radius)
+
+    def get_point_density(self, radius: float = COVERAGE_RADIUS) -> float:
+        """
+        Calculates mean number of other images closer than radius in normalized SIxCF plane
+        :param radius: neighbourhood radius in normalized units
+        :return: mean number of neighbours
+        """
+        return self.index.point_density(radius)
+
+    def get_grid_occupancy(self, resolution: int = GRID_RESOLUTION) -> float:
+        """
+        Calculates fraction of cells of regular grid over normalized SIxCF plane which contain an image
+        :param resolution: number of cells along each axis
+        :return: grid occupancy [0-1]
+        """
+        return self.grid.occupancy(resolution)
+
+    def get_joint_uniformity(self, resolution: int = GRID_RESOLUTION) -> float:
+        """
+        Calculates uniformity of joint SIxCF distribution as normalized entropy of grid cell counts
+        :param resolution: number of cells along each axis
+        :return: joint uniformity [0-1]
+        """
+        return self.grid.joint_uniformity(resolution)
+
+    def get_kde_coverage(self) -> float:
+        """
+        Calculates fraction of normalized SIxCF plane where kernel density estimate of images is significant
+        :return: KDE coverage [0-1]
+        """
+        return self.grid.kde_coverage()
+
+    def plot_all(self, workers: int = 1) -> None:
         """
         Top-level method for generating all plots for the DB
+        :param workers: number of processes rendering plots, 0 means all cores
+        """
+        render_all(self.plot_jobs(), workers)
+
+    def plot_jobs(self, radius: float = 60) -> List[PlotJob]:
         """
-        self.__plot_si_cf_plane()
-        self.__plot_convex_hull()
-        self.__plot_fixed_radius()
-        self.__plot_delaunay()
+        Describes all plots for the DB, so they can be rendered later, possibly in parallel
+        :param radius: radius of the circle representing single image on fixed radius plot
+        :return: list of plot jobs, empty if there is no output directory
+        """
+        if self.output_dir is None:
+            return list()
+        simplices = self.hull.simplices
+        plots = (
+            ("si_cf_plane", dict(points=self.points)),
+            ("convex_hull", dict(points=self.points, simplices=simplices)),
+            (
+                "fixed_radius",
+                dict(points=self.points, simplices=simplices, radius=radius),
+            ),
+            ("delaunay", dict(points=self.points, simplices=simplices)),
+        )
+        axes = dict(
+            xlim=[0, XLIM],
+            ylim=[0, YLIM],
+            xlabel="Colorfulness",
+            ylabel="Spatial Information",
+            title=self.label,
+        )
+        return [
+            PlotJob(
+                f"{self.output_dir}{self.label}_{kind}.png",
+                kind,
+                data,
+                FIG_SIZE,
+                axes,
+                tight=True,
+            )
+            for kind, data in plots
+        ]
 
     def info(self) -> Dict[str, int]:
         try:
@@ -143,48 +338,23 @@ class DatabaseMetrics:
         except yaml.YAMLError as err:
             raise DatabaseMetricsError(f"yaml could not be parsed: '{err}'")
 
-    def __calculate_si_cf(self) -> Tuple[np.ndarray, np.ndarray]:
+    def calculate_fill_rate_fixed_radius_area(
+        self, radius: float = 60, backend: FillRateBackend = FILL_RATE_BACKEND
+    ) -> float:
         """
-        Creates list of SI and CF for each image in the DB
+        Calculates fill rate factor i.e. how well do images fill the convex hull using fixed radius approach
+        It is the ratio of area of circles inside convex hull and convex hull area.
+        :param radius: radius of the circle representing single image
+        :param backend: method of calculating the areas, see FillRateBackend
+        :return: fill rate factor [0-1]
         """
-        for image in self.it:
-            im = ImageMetrics(image)
-            si, cf = im.calculate_si_cf()
-            self.si.append(si)
-            self.cf.append(cf)
-            self.norm_si.append(si / self.max_db_si)
-            self.norm_cf.append(cf / self.max_db_cf)
-        return (
-            np.vstack((self.cf, self.si)).T,
-            np.vstack((self.norm_cf, self.norm_si)).T,
-        )
+        if backend == FillRateBackend.GEOMETRIC:
+            return fill_rate_geometric(self.points, radius)
+        return self.__fill_rate_raster(radius)
 
-    @describe_figure("si_cf_plane.png", "Colorfulness", "Spatial Information")
-    def __plot_si_cf_plane(self, ax=None) -> None:
-        """Plots Spatial Information x Colorfulness plane"""
-        sns.scatterplot(self.cf, self.si, ax=ax)
-
-    @describe_figure("convex_hull.png", "Colorfulness", "Spatial Information")
-    def __plot_convex_hull(self, ax=None) -> None:
-        """Plots Convex Hull for SIxCF plane"""
-        ax.plot(self.points[:, 0], self.points[:, 1], "o")
-        for simplex in self.hull.simplices:
-            ax.plot(self.points[simplex, 0], self.points[simplex, 1], "k-")
-
-    @describe_figure("fixed_radius.png", "Colorfulness", "Spatial Information")
-    def __plot_fixed_radius(self, ax=None, radius: float = 60) -> None:
-        """Plots Convex Hull with fixed radius method for SIxCF plane"""
-        radius *= 72.0 / plt.gcf().dpi
-        ax.plot(self.points[:, 0], self.points[:, 1], "o", markersize=radius)
-        ax.plot(self.points[:, 0], self.points[:, 1], "yx")
-        for simplex in self.hull.simplices:
-            ax.plot(self.points[simplex, 0], self.points[simplex, 1], "k-")
-
-    def calculate_fill_rate_fixed_radius_area(self, radius: float = 60) -> float:
+    def __fill_rate_raster(self, radius: float) -> float:
         """
-        Calculates fill rate factor i.e. how well do images fill the convex hull using fixed radius approach
-        This calculation is based on numerical approach, where ratio two areas is computed.
-        One is area of circles inside convex hull and the other is convex hull area.
+        Calculates fill rate factor using numerical approach based on rasterization.
         Area of circles inside convex hull is computed as follows:
         One plot contains solid polygon representing convex hull and the other is reduced by points of given radius
         representing images in the database.
@@ -193,23 +363,24 @@ class DatabaseMetrics:
         :param radius: radius of the circle representing single image
         :return: fill rate factor [0-1]
         """
-        context_usetex = rcParams["text.usetex"]
-        rc("text", usetex=False)
+        from matplotlib import rc_context
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Polygon
 
-        fig, ax = plt.subplots()
-        plt.figure(figsize=(self.PRECISION, self.PRECISION))
-        canvas = FigureCanvasAgg(fig)
-        fig.patch.set_visible(False)
+        with rc_context(plot_rc(usetex=False)):
+            fig = Figure()
+            canvas = FigureCanvasAgg(fig)
+            ax = fig.subplots()
+            fig.patch.set_visible(False)
 
-        radius *= 72.0 / fig.dpi
-        p = Polygon(self.hull.points[self.hull.vertices], True, color="k")
+            radius *= 72.0 / fig.dpi
+            p = Polygon(self.hull.points[self.hull.vertices], True, color="k")
 
-        self.__plot_convex_hull_for_fill_rate(ax, p, radius, 10)
-        array_with_points = self.__canvas_to_rgb(canvas)
-        self.__plot_convex_hull_for_fill_rate(ax, p, radius, 0)
-        array_without_points = self.__canvas_to_rgb(canvas)
-
-        plt.close()
+            self.__plot_convex_hull_for_fill_rate(ax, p, radius, 10)
+            array_with_points = self.__canvas_to_rgb(canvas)
+            self.__plot_convex_hull_for_fill_rate(ax, p, radius, 0)
+            array_without_points = self.__canvas_to_rgb(canvas)
 
         diff = np.absolute(
             array_with_points.astype("float") - array_without_points.astype("float")
@@ -217,7 +388,6 @@ class DatabaseMetrics:
 
         full = np.where(array_without_points > 128, 0, 1)
         diff = np.where(diff <= 128, 0, 1)
-        rc("text", usetex=context_usetex)
         return min(np.sum(diff) / np.sum(full), 1.0)
 
     def __plot_convex_hull_for_fill_rate(self, ax, p, radius, zorder):
@@ -234,15 +404,6 @@ class DatabaseMetrics:
         array = np.array(canvas.renderer.buffer_rgba()).copy()
         return np.delete(array, 3, 2)  # Remove alpha channel
 
-    @describe_figure("delaunay.png", "Colorfulness", "Spatial Information")
-    def __plot_delaunay(self, ax=None) -> None:
-        """Plots Delaunay triangulation for SIxCF plane"""
-        for simplex in self.hull.simplices:
-            ax.plot(self.points[simplex, 0], self.points[simplex, 1], "r-")
-
-        tri = Delaunay(self.points)
-        ax.triplot(self.points[:, 0], self.points[:, 1], tri.simplices.copy(), lw=1)
-
     def __str__(self) -> str:
         """Returns lists of SI and CF"""
         return f"SI: {self.si}, CF: {self.cf}"
@@ -0,0 +1,213 @@
+"""Sharded calculation of per image metrics, whose partial results are merged in shared store"""
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+from app.database_collection import DatabaseCollection
+from app.database_metrics import DatabaseMetricsError, list_images
+from app.database_summary import (
+    DatabaseSummary,
+    DatabaseSummaryError,
+    summaries_from_tables,
+    summaries_to_tables,
+)
+from app.image_metrics_pool import ImageMetricsPool, ImageRecord
+from app.metrics_store import (
+    HULL_TABLE,
+    IMAGE_COLUMNS,
+    IMAGES_TABLE,
+    SUMMARY_TABLE,
+    MetricsStore,
+    MetricsStoreError,
+)
+
+
+class DatabaseShardError(Exception):
+    """Database Shard Error raised on wrong shard or missing partial results"""
+
+
+def shard_table(table: str, index: int, count: int) -> str:
+    """
+    Name of partial table written by single shard
+    :param table: name of the merged table
+    :param index: index of the shard
+    :param count: number of shards
+    :return: table name, e.g. "images_shard_0_of_4"
+    """
+    return f"{table}_shard_{index}_of_{count}"
+
+
+def select_shard(
+    parent_dir: str, index: int, count: int
+) -> Tuple[np.ndarray, List[Tuple[str, str]]]:
+    """
+    Deterministically selects images of the shard
+    All images of all DBs are listed in sorted order and every count-th image belongs to the shard,
+    so shards are balanced even if DBs differ in size.
+    :param parent_dir: parent directory of all DBs
+    :param index: index of the shard, 0 <= index < count
+    :param count: number of shards
+    :return: global positions of selected images and their DB and path
+    """
+    if count < 1 or not 0 <= index < count:
+        raise DatabaseShardError(f"Wrong shard {index} of {count}")
+    try:
+        images = [
+            (db, image)
+            for db in DatabaseCollection(parent_dir)
+            for image in list_images(parent_dir + db)
+        ]
+    except DatabaseMetricsError as err:
+        raise DatabaseShardError(str(err))
+    positions = np.arange(index, len(images), count)
+    return positions, [images[i] for i in positions]
+
+
+def summarize(
+    dbs: np.ndarray, si: np.ndarray, cf: np.ndarray
+) -> Dict[str, DatabaseSummary]:
+    """
+    Calculates mergeable summary (hull vertices, extrema, count and entropy sums) of each DB
+    :param dbs: DB of each image
+    :param si: SI of each image
+    :param cf: CF of each image
+    :return: DB to summary mapping
+    """
+    return {
+        str(db): DatabaseSummary(si[dbs == db], cf[dbs == db]) for db in np.unique(dbs)
+    }
+
+
+def merge_summaries(
+    summaries: List[Dict[str, DatabaseSummary]],
+) -> Dict[str, DatabaseSummary]:
+    """
+    Merges per DB summaries of several shards
+    :param summaries: summaries of the shards
+    :return: summaries of all shards sorted by DB
+    """
+    merged: Dict[str, DatabaseSummary] = dict()
+    for shard in summaries:
+        for db, summary in shard.items():
+            merged.setdefault(db, DatabaseSummary()).merge(summary)
+    return {db: merged[db] for db in sorted(merged)}
+
+
+def write_summaries(
+    ms: MetricsStore, summaries: Dict[str, DatabaseSummary], suffix: str = ""
+) -> None:
+    """
+    Writes summaries as summary and hull tables
+    :param ms: metrics store
+    :param summaries: DB to summary mapping
+    :param suffix: suffix of table names, e.g. of the shard
+    """
+    summary, hull = summaries_to_tables(summaries)
+    ms.write_table(SUMMARY_TABLE + suffix, summary)
+    ms.write_table(HULL_TABLE + suffix, hull)
+
+
+def read_summaries(ms: MetricsStore, suffix: str = "") -> Dict[str, DatabaseSummary]:
+    """
+    Reads summaries written by write_summaries
+    :param ms: metrics store
+    :param suffix: suffix of table names, e.g. of the shard
+    :return: DB to summary mapping
+    """
+    return summaries_from_tables(
+        ms.read_table(SUMMARY_TABLE + suffix, mmap=False),
+        ms.read_table(HULL_TABLE + suffix, mmap=False),
+    )
+
+
+def analyze_shard(
+    parent_dir: str,
+    store: str,
+    index: int,
+    count: int,
+    workers: int = 1,
+    decode_scale: int = 1,
+) -> int:
+    """
+    Calculates metrics of images in the shard and writes partial image and summary tables to shared store
+    :param parent_dir: parent directory of all DBs
+    :param store: directory of the store shared by all shards
+    :param index: index of the shard, 0 <= index < count
+    :param count: number of shards
+    :param workers: number of processes calculating image metrics, 0 means all cores
+    :param decode_scale: maximal reduction factor of decoded images, 1 means full resolution
+    :return: number of processed images
+    """
+    positions, images = select_shard(parent_dir, index, count)
+    logging.debug(f"Shard {index} of {count}: calculating {len(images)} images")
+    records = ImageMetricsPool(workers, decode_scale, timed=True).calculate_records(
+        [image for _, image in images]
+    )
+    dbs = np.array([db for db, _ in images], dtype=str)
+    columns = {
+        "position": positions,
+        "db": dbs,
+        "file": np.array(
+            [os.path.relpath(image, parent_dir + db) for db, image in images],
+            dtype=str,
+        ),
+    }
+    for field in ImageRecord._fields:
+        columns[field] = np.array([getattr(record, field) for record in records])
+    try:
+        ms = MetricsStore(store)
+        ms.write_table(shard_table(IMAGES_TABLE, index, count), columns)
+        write_summaries(
+            ms,
+            summarize(dbs, columns["si"], columns["cf"]),
+            shard_table("", index, count),
+        )
+    except MetricsStoreError as err:
+        raise DatabaseShardError(str(err))
+    return len(images)
+
+
+def merge_shards(store: str, count: int) -> Dict[str, DatabaseSummary]:
+    """
+    Merges partial results of all shards into images table, so analysis can be loaded from the store
+    :param store: directory of the store shared by all shards
+    :param count: number of shards
+    :return: merged per DB summary
+    """
+    ms = MetricsStore(store)
+    missing = [
+        i for i in range(count) if not ms.exists(shard_table(IMAGES_TABLE, i, count))
+    ]
+    if count < 1 or missing:
+        raise DatabaseShardError(f"Results of shards {missing} of {count} are missing")
+    try:
+        parts = [
+            ms.read_table(
+                shard_table(IMAGES_TABLE, i, count),
+                mmap=False,
+                required=("position",) + IMAGE_COLUMNS,
+            )
+            for i in range(count)
+        ]
+        summaries = [
+            read_summaries(ms, shard_table("", i, count)) for i in range(count)
+        ]
+        positions = np.concatenate([part["position"] for part in parts])
+        order = np.argsort(positions, kind="stable")
+        columns = {
+            name: np.concatenate([part[name] for part in parts])[order]
+            for name in parts[0]
+            if name != "position"
+        }
+        summary = merge_summaries(summaries)
+        ms.write_table(IMAGES_TABLE, columns)
+        write_summaries(ms, summary)
+    except (MetricsStoreError, DatabaseSummaryError, KeyError) as err:
+        raise DatabaseShardError(f"Shards could not be merged: {err}")
+    logging.debug(
+        f"Merged {len(positions)} images of {count} shards, "
+        f"max SI: '{max(s.si_max for s in summary.values())}', "
+        f"max CF: '{max(s.cf_max for s in summary.values())}'"
+    )
+    return summary
@@ -0,0 +1,244 @@
+"""Compact mergeable summary of DB needed for normalization, convex hull area, ranges and uniformity"""
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+
+SUMMARY_CHUNK = int(os.getenv("SUMMARY_CHUNK", 1 << 16))
+SUMMARY_COLUMNS = (
+    "images",
+    "si_min",
+    "si_max",
+    "cf_min",
+    "cf_max",
+    "si_sum",
+    "si_log_sum",
+    "cf_sum",
+    "cf_log_sum",
+)
+
+
+class DatabaseSummaryError(Exception):
+    """Database Summary Error raised on inconsistent summary tables"""
+
+
+def weighted_logs(values: np.ndarray) -> np.ndarray:
+    """
+    Calculates values weighted by their natural logarithm, summed they give entropy
+    :param values: array of non-negative values
+    :return: values * ln(values), 0 for zero values
+    """
+    logs = np.log(values, out=np.zeros_like(values), where=values > 0)
+    return values * logs
+
+
+def entropy_sums(si: Sequence[float], cf: Sequence[float]) -> np.ndarray:
+    """
+    Calculates sums needed for entropy of SI and CF, which can be updated when images change
+    :param si: SI values
+    :param cf: CF values
+    :return: array [[sum(si), sum(si * ln(si))], [sum(cf), sum(cf * ln(cf))]]
+    """
+    values = np.array((si, cf), dtype=float)
+    return np.vstack((values.sum(axis=1), weighted_logs(values).sum(axis=1))).T
+
+
+def uniformity(sums: np.ndarray) -> Tuple[float, float]:
+    """
+    Calculates SI and CF uniformity as base 10 entropy from sums of values and their weighted logarithms
+    :param sums: entropy sums, see entropy_sums, optionally with trailing axis of DBs
+    :return: Tuple of (SI, CF) uniformity, arrays for sums of several DBs
+    """
+    total, weighted_logs = sums[:, 0], sums[:, 1]
+    si_uni, cf_uni = (np.log(total) - weighted_logs / total) / np.log(10)
+    return si_uni, cf_uni
+
+
+def hull_vertices(points: np.ndarray) -> np.ndarray:
+    """
+    Reduces points to vertices of their convex hull
+    Degenerate (collinear) sets are reduced to their two extreme points.
+    :param points: N x 2 array of points
+    :return: hull vertices in counterclockwise order
+    """
+    if len(points) < 3:
+        return points
+    try:
+        return points[ConvexHull(points).vertices]
+    except QhullError:
+        order = np.lexsort((points[:, 1], points[:, 0]))
+        return points[[order[0], order[-1]]]
+
+
+class DatabaseSummary:
+    """
+    Summary of single DB made of convex hull vertices, extrema, image count and entropy sums.
+    Its memory is O(hull size) regardless of number of images, summaries of parts of the DB can be merged.
+    Points are in (CF, SI) order like DatabaseMetrics.points.
+    """
+
+    def __init__(
+        self,
+        si: Optional[Sequence[float]] = None,
+        cf: Optional[Sequence[float]] = None,
+    ) -> None:
+        """
+        Creates summary, optionally of given images
+        :param si: raw SI of images
+        :param cf: raw CF of images
+        """
+        self.images = 0
+        self.si_min = math.inf
+        self.si_max = -math.inf
+        self.cf_min = math.inf
+        self.cf_max = -math.inf
+        self.entropy_sums = np.zeros((2, 2))
+        self.hull_points = np.empty((0, 2))
+        if si is not None and cf is not None:
+            self.update(si, cf)
+
+    def update(self, si: Sequence[float], cf: Sequence[float]) -> None:
+        """
+        Adds images to the summary, values are processed in chunks of SUMMARY_CHUNK images
+        :param si: raw SI of new images
+        :param cf: raw CF of new images
+        """
+        si_values = np.asarray(si, dtype=float)
+        cf_values = np.asarray(cf, dtype=float)
+        for start in range(0, len(si_values), SUMMARY_CHUNK):
+            chunk = slice(start, start + SUMMARY_CHUNK)
+            si_chunk, cf_chunk = si_values[chunk], cf_values[chunk]
+            self.images += len(si_chunk)
+            self.si_min = min(self.si_min, float(si_chunk.min()))
+            self.si_max = max(self.si_max, float(si_chunk.max()))
+            self.cf_min = min(self.cf_min, float(cf_chunk.min()))
+            self.cf_max = max(self.cf_max, float(cf_chunk.max()))
+            self.entropy_sums += entropy_sums(si_chunk, cf_chunk)
+            points = np.column_stack((cf_chunk, si_chunk))
+            self.hull_points = hull_vertices(np.vstack((self.hull_points, points)))
+
+    def merge(self, other: "DatabaseSummary") -> None:
+        """
+        Adds images summarized by other summary of the same DB
+        :param other: summary of other part of the DB
+        """
+        self.images += other.images
+        self.si_min = min(self.si_min, other.si_min)
+        self.si_max = max(self.si_max, other.si_max)
+        self.cf_min = min(self.cf_min, other.cf_min)
+        self.cf_max = max(self.cf_max, other.cf_max)
+        self.entropy_sums += other.entropy_sums
+        self.hull_points = hull_vertices(
+            np.vstack((self.hull_points, other.hull_points))
+        )
+
+    def get_max_si_cf(self) -> Tuple[float, float]:
+        """
+        Returns maximum value of Spatial Information and Colorfulness for the DB
+        :return: Tuple (max_si, max_cf)
+        """
+        return self.si_max, self.cf_max
+
+    def get_si_cf_ranges(self, max_si_cf: Tuple[float, float]) -> Tuple[float, float]:
+        """
+        Calculates SI and CF relative ranges
+        :param max_si_cf: Maximum values of SI and CF across all analyzed databases
+        :return: Tuple of (SI, CF) relative ranges
+        """
+        si_range = (self.si_max - self.si_min) / max_si_cf[0]
+        cf_range = (self.cf_max - self.cf_min) / max_si_cf[1]
+        return si_range, cf_range
+
+    def get_si_cf_uniformity(self) -> Tuple[float, float]:
+        """
+        Calculates SI and CF uniformity as base 10 entropy of SI and CF distributions
+        :return: Tuple of (SI, CF) uniformity
+        """
+        return uniformity(self.entropy_sums)
+
+    def get_coverage_area(self, max_si_cf: Tuple[float, float]) -> float:
+        """
+        Calculates normalized convex hull area from hull vertices only
+        Normalization scales both axes, so hull area is divided by product of the maxima.
+        :param max_si_cf: Maximum values of SI and CF across all analyzed databases
+        :return: Convex Hull area, 0 for degenerate DB
+        """
+        if len(self.hull_points) < 3:
+            return 0.0
+        cf, si = self.hull_points[:, 0], self.hull_points[:, 1]
+        area = 0.5 * abs(np.dot(cf, np.roll(si, -1)) - np.dot(si, np.roll(cf, -1)))
+        return math.sqrt(area / (max_si_cf[0] * max_si_cf[1]))
+
+
+def summaries_to_tables(
+    summaries: Dict[str, DatabaseSummary],
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Converts summaries to columnar tables, e.g. for MetricsStore
+    :param summaries: DB to summary mapping
+    :return: summary table with one row per DB and hull table with one row per hull vertex
+    """
+    dbs = list(summaries)
+    rows: List[List[float]] = [
+        [
+            s.images,
+            s.si_min,
+            s.si_max,
+            s.cf_min,
+            s.cf_max,
+            *s.entropy_sums.ravel().tolist(),
+        ]
+        for s in summaries.values()
+    ]
+    values = np.array(rows, dtype=float).reshape(len(dbs), len(SUMMARY_COLUMNS))
+    summary = {"db": np.array(dbs, dtype=str)}
+    for i, column in enumerate(SUMMARY_COLUMNS):
+        summary[column] = values[:, i]
+    summary["images"] = summary["images"].astype(np.int64)
+    points = [s.hull_points for s in summaries.values()]
+    hull = {
+        "db": np.array(
+            [db for db, p in zip(dbs, points) for _ in range(len(p))], dtype=str
+        ),
+        "cf": np.concatenate([p[:, 0] for p in points]) if dbs else np.empty(0),
+        "si": np.concatenate([p[:, 1] for p in points]) if dbs else np.empty(0),
+    }
+    return summary, hull
+
+
+def summaries_from_tables(
+    summary: Dict[str, np.ndarray], hull: Dict[str, np.ndarray]
+) -> Dict[str, DatabaseSummary]:
+    """
+    Restores summaries from columnar tables written by summaries_to_tables
+    :param summary: summary table
+    :param hull: hull table
+    :return: DB to summary mapping
+    """
+    try:
+        hull_dbs = np.asarray(hull["db"])
+        summaries: Dict[str, DatabaseSummary] = dict()
+        for i, db in enumerate(np.asarray(summary["db"]).tolist()):
+            s = DatabaseSummary()
+            s.images = int(summary["images"][i])
+            s.si_min, s.si_max = float(summary["si_min"][i]), float(
+                summary["si_max"][i]
+            )
+            s.cf_min, s.cf_max = float(summary["cf_min"][i]), float(
+                summary["cf_max"][i]
+            )
+            s.entropy_sums = np.array(
+                [
+                    [summary["si_sum"][i], summary["si_log_sum"][i]],
+                    [summary["cf_sum"][i], summary["cf_log_sum"][i]],
+                ],
+                dtype=float,
+            )
+            mask = hull_dbs == db
+            s.hull_points = np.column_stack((hull["cf"][mask], hull["si"][mask]))
+            summaries[db] = s
+    except KeyError as err:
+        raise DatabaseSummaryError(f"Summary table is missing column {err}")
+    return summaries
@@ -0,0 +1,88 @@
+"""Occupancy grid and kernel density coverage of normalized SI x CF plane computed from 2-D histograms"""
+import os
+from typing import Dict
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+GRID_RESOLUTION = int(os.getenv("GRID_RESOLUTION", 16))
+KDE_RESOLUTION = int(os.getenv("KDE_RESOLUTION", 128))
+KDE_BANDWIDTH = float(os.getenv("KDE_BANDWIDTH", 0.05))
+KDE_THRESHOLD = float(os.getenv("KDE_THRESHOLD", 0.1))
+
+
+class GridDensityError(Exception):
+    """Grid Density Error raised on wrong input params"""
+
+
+class GridDensity:
+    """
+    Histograms of normalized (CF, SI) points over the unit square.
+    Histogram of each resolution is computed once in O(N) and cached, metrics using it then depend
+    only on the grid size, so grid occupancy and joint uniformity share single pass over the points.
+    """
+
+    def __init__(self, points: np.ndarray) -> None:
+        """
+        Creates grid density
+        :param points: array of normalized (CF, SI) points
+        """
+        self.points = points
+        self.histograms: Dict[int, np.ndarray] = dict()
+
+    def histogram(self, resolution: int) -> np.ndarray:
+        """
+        Counts points in cells of regular grid over the unit square, counts are cached per resolution
+        :param resolution: number of cells along each axis
+        :return: resolution x resolution array of counts, must not be modified
+        """
+        # Single cell grid is always occupied and has no entropy to normalize joint uniformity with
+        if resolution < 2:
+            raise GridDensityError(f"Grid resolution must be at least 2 '{resolution}'")
+        if resolution not in self.histograms:
+            self.histograms[resolution], _, _ = np.histogram2d(
+                self.points[:, 0],
+                self.points[:, 1],
+                bins=resolution,
+                range=[[0.0, 1.0], [0.0, 1.0]],
+            )
+        return self.histograms[resolution]
+
+    def occupancy(self, resolution: int = GRID_RESOLUTION) -> float:
+        """
+        Calculates fraction of grid cells containing at least one point
+        :param resolution: number of cells along each axis
+        :return: occupancy [0-1]
+        """
+        return float(np.count_nonzero(self.histogram(resolution))) / resolution ** 2
+
+    def joint_uniformity(self, resolution: int = GRID_RESOLUTION) -> float:
+        """
+        Calculates joint SI x CF uniformity as entropy of the cell histogram relative to its maximum,
+        which is reached when points are spread evenly over all cells
+        :param resolution: number of cells along each axis
+        :return: uniformity [0-1]
+        """
+        counts = self.histogram(resolution)
+        p = counts[counts > 0] / counts.sum()
+        return float(-np.sum(p * np.log(p)) / np.log(resolution ** 2))
+
+    def kde_coverage(
+        self,
+        bandwidth: float = KDE_BANDWIDTH,
+        threshold: float = KDE_THRESHOLD,
+        resolution: int = KDE_RESOLUTION,
+    ) -> float:
+        """
+        Calculates fraction of the unit square where Gaussian kernel density estimate of the points
+        reaches threshold times the density of uniform distribution
+        Density is obtained by separable Gaussian filtering of fine histogram, mass leaving the square is lost.
+        :param bandwidth: standard deviation of the kernel in normalized units
+        :param threshold: minimal density relative to uniform density
+        :param resolution: number of cells along each axis
+        :return: coverage [0-1]
+        """
+        counts = self.histogram(resolution)
+        smoothed = gaussian_filter(counts, bandwidth * resolution, mode="constant")
+        density = smoothed * resolution ** 2 / len(self.points)
+        return float(np.mean(density >= threshold))
@@ -0,0 +1,153 @@
+"""Vectorized processing for stacks of images with the same size"""
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+from app.image_metrics import DECODE_SCALE, ImageMetrics, ImageMetricsInputError
+
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 64))
+BATCH_PIXELS = int(os.getenv("BATCH_PIXELS", 1 << 20))
+
+
+class ImageBatchMetrics:
+    """
+    Class for calculating metrics for N x H x W x 3 stack of images at once.
+    Stack is processed in chunks of about BATCH_PIXELS pixels by single OpenCV/NumPy call per step,
+    so there is no per image Python overhead and temporary buffers stay small.
+    """
+
+    def __init__(self, images: np.ndarray) -> None:
+        """
+        Create ImageBatchMetrics for stack of BGR images
+        :param images: uint8 array of shape N x H x W x 3
+        """
+        if (
+            not isinstance(images, np.ndarray)
+            or images.dtype != np.uint8
+            or images.ndim != 4
+            or images.shape[3] != 3
+        ):
+            raise ImageMetricsInputError("Provide uint8 array of shape N x H x W x 3")
+        if images.shape[1] < 2 or not images.shape[0] * images.shape[2]:
+            raise ImageMetricsInputError(f"Provided stack is empty '{images.shape}'")
+        self.images = images
+
+    def calculate_si_cf(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculates both Spatial Information and Colorfulness for all images in the stack
+        :return: tuple of SI and CF arrays of length N
+        """
+        n, rows, cols = self.images.shape[:3]
+        step = max(1, BATCH_PIXELS // (rows * cols))
+        si = np.empty(n)
+        cf = np.empty(n)
+        for start in range(0, n, step):
+            chunk = slice(start, start + step)
+            si[chunk] = self.__calculate_spatial_information(
+                self.__sobel_sums(self.images[chunk])
+            )
+            cf[chunk] = self.__calculate_colorfulness(
+                self.__opponent_moments(self.images[chunk])
+            )
+        return si, cf
+
+    @staticmethod
+    def __sobel_sums(images: np.ndarray) -> np.ndarray:
+        """
+        Calculates per image and per channel sums of squared Sobel gradients
+        Images are padded by one reflected row on top and bottom (the same border OpenCV uses for single image)
+        and stacked vertically, so the 3x3 Sobel of the whole stack never mixes rows of neighbouring images.
+        Squared gradients are summed per row in float64 and rows of the padding are dropped afterwards.
+        :param images: chunk of the stack
+        :return: N x 3 array of sums
+        """
+        n, rows, cols, _ = images.shape
+        padded = np.pad(images, ((0, 0), (1, 1), (0, 0), (0, 0)), mode="reflect")
+        stacked = padded.reshape(n * (rows + 2), cols, 3)
+        row_sums = np.zeros((n * (rows + 2), 1, 3))
+        gradient = np.empty(stacked.shape, np.float32)
+        for dx, dy in ((1, 0), (0, 1)):
+            cv2.Sobel(stacked, cv2.CV_32F, dx, dy, dst=gradient, ksize=3)
+            cv2.multiply(gradient, gradient, dst=gradient)
+            row_sums += cv2.reduce(gradient, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F)
+        return row_sums.reshape(n, rows + 2, 3)[:, 1:-1].sum(axis=1)
+
+    @staticmethod
+    def __opponent_moments(images: np.ndarray) -> np.ndarray:
+        """
+        Calculates per image sums and sums of squares of opponent channels rg = R - G and yb = (R + G) / 2 - B
+        Integer opponent channels are accumulated in int64, so the moments are exact.
+        :param images: chunk of the stack
+        :return: N x 2 x 2 array [[sum_rg, sum_sq_rg], [sum_yb, sum_sq_yb]] for each image
+        """
+        blue, green, red = (images[..., c].astype(np.int32) for c in range(3))
+        rg = red - green
+        yb = red + green - 2 * blue
+        moments = np.empty((len(images), 2, 2))
+        for channel, (values, scale) in enumerate(((rg, 1.0), (yb, 0.5))):
+            moments[:, channel, 0] = values.sum(axis=(1, 2), dtype=np.int64) * scale
+            np.multiply(values, values, out=values)
+            moments[:, channel, 1] = (
+                values.sum(axis=(1, 2), dtype=np.int64) * scale ** 2
+            )
+        return moments
+
+    def __calculate_spatial_information(self, sobel: np.ndarray) -> np.ndarray:
+        """
+        Calculates spatial information for all images
+        :param sobel: N x 3 per channel sums of squared Sobel gradients
+        :return: array of Spatial Information values
+        """
+        rows, cols = self.images.shape[1:3]
+        si_bgr = np.sqrt(rows / 1080.0) * np.sqrt(sobel / (rows * cols))
+        return si_bgr @ np.array([0.114, 0.587, 0.299])
+
+    def __calculate_colorfulness(self, moments: np.ndarray) -> np.ndarray:
+        """
+        Calculates Colorfulness for all images
+        :param moments: N x 2 x 2 sums and sums of squares of opponent channels
+        :return: array of Colorfulness values
+        """
+        pixels = self.images.shape[1] * self.images.shape[2]
+        mu = moments[:, :, 0] / pixels
+        sigma_sq = np.maximum(moments[:, :, 1] / pixels - mu ** 2, 0.0)
+        return np.sqrt(sigma_sq.sum(axis=1)) + 0.3 * np.sqrt((mu ** 2).sum(axis=1))
+
+
+def calculate_si_cf_files(
+    images: Sequence[str],
+    batch_size: int = BATCH_SIZE,
+    decode_scale: int = DECODE_SCALE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates SI and CF for image files, images of the same size are grouped and processed in batches.
+    When batch_size images are decoded, the largest group is processed, so smaller groups can still grow.
+    :param images: paths to the images
+    :param batch_size: maximal number of decoded images kept in memory
+    :param decode_scale: maximal reduction factor of decoded images, 1 means full resolution
+    :return: tuple of SI and CF arrays in the same order as images
+    """
+    if batch_size < 1:
+        raise ImageMetricsInputError(f"Batch size must be positive '{batch_size}'")
+    si = np.empty(len(images))
+    cf = np.empty(len(images))
+    groups: Dict[Tuple[int, ...], List[Tuple[int, np.ndarray]]] = dict()
+
+    def flush(shape: Tuple[int, ...]) -> None:
+        group = groups.pop(shape)
+        indices = [index for index, _ in group]
+        stack = np.stack([img for _, img in group])
+        si[indices], cf[indices] = ImageBatchMetrics(stack).calculate_si_cf()
+
+    for index, image in enumerate(images):
+        try:
+            img = ImageMetrics(image, decode_scale=decode_scale).img
+        except ImageMetricsInputError as err:
+            raise ImageMetricsInputError(f"Error during processing '{image}': {err}")
+        groups.setdefault(img.shape, list()).append((index, img))
+        if sum(len(group) for group in groups.values()) == batch_size:
+            flush(max(groups, key=lambda shape: len(groups[shape])))
+    for shape in list(groups):
+        flush(shape)
+    return si, cf
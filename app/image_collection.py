@@ -1,34 +1,72 @@
 """Tools for handling multiple images in the DB"""
 
-from os import listdir
-from os.path import isdir, isfile, join
+import os
+from os.path import isdir
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+RECURSIVE_SCAN = os.getenv("RECURSIVE_SCAN", "0") == "1"
+RAW_EXTENSION = ".npy"
+FRAME_SEPARATOR = "#"
 
 
 class ImageIteratorInputError(Exception):
     """Image Iterator Error raised on wrong input params"""
 
 
+def split_frame(path: str) -> Tuple[str, Optional[int]]:
+    """
+    Splits path of frame stored in raw array file, e.g. "frames.npy#3"
+    :param path: path to the image or frame
+    :return: path to the file and index of the frame, None if path is not a frame
+    """
+    filename, separator, index = path.rpartition(FRAME_SEPARATOR)
+    if separator and filename.lower().endswith(RAW_EXTENSION) and index.isdigit():
+        return filename, int(index)
+    return path, None
+
+
+def is_raw(path: str) -> bool:
+    """
+    Checks whether image is stored as raw uncompressed array (.npy file or its frame)
+    :param path: path to the image or frame
+    :return: True for raw arrays
+    """
+    return split_frame(path)[0].lower().endswith(RAW_EXTENSION)
+
+
+def raw_frames(filename: str) -> List[str]:
+    """
+    Lists images stored in raw array file, only .npy header is read
+    :param filename: path to H x W x 3 image or N x H x W x 3 stack of frames
+    :return: filename itself for single image, frame paths for stack
+    """
+    try:
+        shape = np.load(filename, mmap_mode="r").shape
+    except (OSError, ValueError) as err:
+        raise ImageIteratorInputError(
+            f"Raw array could not be read '{filename}': {err}"
+        )
+    if len(shape) == 4:
+        return [f"{filename}{FRAME_SEPARATOR}{i}" for i in range(shape[0])]
+    return [filename]
+
+
 class ImageIterator:
     """Iterator class for getting all images"""
 
     def __init__(self, image_collection) -> None:
         """Iterator init"""
         self._image_collection = image_collection
-        self._index = 0
+        self._files = image_collection.scan()
 
     def __next__(self) -> str:
         """
         Next image
         :return: filename with path of the DB
         """
-        if self._index < len(self._image_collection.files):
-            result = (
-                self._image_collection.directory
-                + self._image_collection.files[self._index]
-            )
-            self._index += 1
-            return result
-        raise StopIteration
+        return self._image_collection.directory + next(self._files)
 
     def __iter__(self):
         """
@@ -39,31 +77,94 @@ class ImageIterator:
 
 
 class ImageCollection:
-    """Collection of images in the database based on iterator"""
+    """
+    Collection of images in the database based on iterator.
+    Directory is scanned lazily with os.scandir, so file types come from directory entries without
+    additional stat calls and images are yielded before the scan of the whole DB finishes.
+    Scanned images are kept, so the DB is scanned only once however many times it is iterated.
+    Raw .npy arrays of N x H x W x 3 frames yield one "file.npy#index" path per frame.
+    """
 
     IMAGE_EXTENSIONS = (".png", ".bmp", ".jpeg", ".jpg", ".gif", ".tiff")
 
-    def __init__(self, directory: str) -> None:
+    def __init__(
+        self, directory: str, recursive: bool = RECURSIVE_SCAN, sort: bool = True
+    ) -> None:
         """
         Create image collection
         :param directory: path to the DB directory
+        :param recursive: whether images in nested subdirectories should be included
+        :param sort: whether entries of each directory should be yielded in sorted order
         """
         if not isdir(directory):
             raise ImageIteratorInputError(
                 f"Provided path is not directory '{directory}'"
             )
-        self.files = [
-            f
-            for f in listdir(directory)
-            if isfile(join(directory, f)) and f.endswith(self.IMAGE_EXTENSIONS)
-        ]
-        if not len(self.files):
-            raise ImageIteratorInputError(
-                f"Provided path does not contain files '{directory}'"
-            )
         self.directory = directory
         if not self.directory.endswith("/"):
             self.directory += "/"
+        self.recursive = recursive
+        self.sort = sort
+        self.__scanner: Optional[Iterator[str]] = self.__scan_directory("")
+        self.__scanned: List[str] = list()
+        # Scan continues only until the first image, the rest is scanned during iteration
+        if not self.__scan_next():
+            raise ImageIteratorInputError(
+                f"Provided path does not contain files '{self.directory}'"
+            )
+
+    def __scan_directory(self, prefix: str) -> Iterator[str]:
+        """
+        Yields images of single directory and optionally of its subdirectories (depth first)
+        :param prefix: path of the directory relative to the DB, empty or ending with "/"
+        :return: generator of image paths relative to the DB
+        """
+        with os.scandir(self.directory + prefix) as it:
+            entries = sorted(it, key=lambda e: e.name) if self.sort else it
+            subdirs = list()
+            for entry in entries:
+                if entry.is_file():
+                    if entry.name.lower().endswith(self.IMAGE_EXTENSIONS):
+                        yield prefix + entry.name
+                    elif entry.name.lower().endswith(RAW_EXTENSION):
+                        for frame in raw_frames(entry.path):
+                            yield prefix + os.path.basename(frame)
+                elif self.recursive and entry.is_dir():
+                    subdirs.append(entry.name)
+        for subdir in subdirs:
+            yield from self.__scan_directory(prefix + subdir + "/")
+
+    def __scan_next(self) -> bool:
+        """
+        Continues the scan of the DB by single image
+        :return: False if the whole DB is already scanned
+        """
+        if self.__scanner is None:
+            return False
+        try:
+            self.__scanned.append(next(self.__scanner))
+            return True
+        except StopIteration:
+            self.__scanner = None
+            return False
+
+    def scan(self) -> Iterator[str]:
+        """
+        Lazily yields images of the DB, images found by earlier scans are not scanned again
+        :return: generator of image paths relative to the DB
+        """
+        index = 0
+        while index < len(self.__scanned) or self.__scan_next():
+            yield self.__scanned[index]
+            index += 1
+
+    @property
+    def files(self) -> List[str]:
+        """
+        All images of the DB
+        :return: list of image paths relative to the DB
+        """
+        return list(self.scan())
 
     def __iter__(self) -> ImageIterator:
         """
@@ -0,0 +1,140 @@
+"""Detection of byte-identical images and near-duplicates based on perceptual hash"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+from app.image_collection import is_raw
+from app.image_metrics import ImageMetricsInputError, read_raw
+from app.metrics_cache import file_hash
+
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", 6))
+HASH_CHUNK = 1024
+
+# Number of set bits of every 16 bit value, used for Hamming distance of 64 bit hashes
+POPCOUNT_16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+class ImageDedupError(Exception):
+    """Image Dedup Error raised when perceptual hash could not be calculated"""
+
+
+def unique_files(paths: Sequence[str]) -> Tuple[List[int], List[int]]:
+    """
+    Finds byte-identical files, only files of the same size are hashed
+    Files which could not be read and frames of raw stacks ("file.npy#index") are treated as unique,
+    so errors are reported by the caller.
+    :param paths: paths to the files
+    :return: indices of first occurrences of unique files and index into them for every path
+    """
+    sizes: Dict[int, List[int]] = dict()
+    keys: List[object] = list()
+    for i, path in enumerate(paths):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = -1 - i
+        sizes.setdefault(size, list()).append(i)
+        keys.append(size)
+    for size, indices in sizes.items():
+        if len(indices) > 1:
+            for i in indices:
+                try:
+                    keys[i] = (size, file_hash(paths[i]))
+                except OSError:
+                    keys[i] = (size, i)
+
+    unique: List[int] = list()
+    inverse: List[int] = list()
+    first: Dict[object, int] = dict()
+    for i, key in enumerate(keys):
+        if key not in first:
+            first[key] = len(unique)
+            unique.append(i)
+        inverse.append(first[key])
+    return unique, inverse
+
+
+def perceptual_hash(filename: str) -> int:
+    """
+    Calculates 64 bit difference hash (dHash) of the image
+    Image is decoded at reduced resolution in grayscale (raw images are converted), shrunk to 9x8 pixels
+    and each bit tells whether pixel is brighter than its right neighbour, so hash survives rescaling
+    and recompression.
+    :param filename: path to the image
+    :return: perceptual hash
+    """
+    if is_raw(filename):
+        try:
+            img = cv2.cvtColor(
+                np.ascontiguousarray(read_raw(filename)), cv2.COLOR_BGR2GRAY
+            )
+        except (ImageMetricsInputError, cv2.error) as err:
+            raise ImageDedupError(f"Image could not be read '{filename}': {err}")
+    else:
+        img = cv2.imread(filename, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        img = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ImageDedupError(f"Image could not be read '{filename}'")
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def perceptual_hashes(images: Sequence[str], workers: int = 1) -> np.ndarray:
+    """
+    Calculates perceptual hashes of images, optionally in pool of processes
+    :param images: paths to the images
+    :param workers: number of worker processes, 1 runs serially
+    :return: array of uint64 hashes
+    """
+    if workers == 1 or len(images) < 2:
+        hashes = [perceptual_hash(image) for image in images]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(images) // (workers * 4))
+            hashes = list(executor.map(perceptual_hash, images, chunksize=chunksize))
+    return np.array(hashes, dtype=np.uint64)
+
+
+def hamming_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Calculates Hamming distance of 64 bit hashes, arrays are broadcast against each other
+    :param a: uint64 hashes
+    :param b: uint64 hashes
+    :return: number of differing bits
+    """
+    xor = np.bitwise_xor(a, b, dtype=np.uint64)
+    counts = POPCOUNT_16[np.ascontiguousarray(xor).reshape(-1).view(np.uint16)]
+    return counts.reshape(xor.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+
+
+def near_duplicates(
+    hashes: np.ndarray, groups: np.ndarray, max_distance: int = NEAR_DUPLICATE_DISTANCE
+) -> List[Tuple[int, int, int]]:
+    """
+    Finds pairs of images from different groups (DBs) whose hashes differ in at most max_distance bits
+    All pairs are compared, so time is O(N^2). Blocks of HASH_CHUNK x HASH_CHUNK pairs are compared at once
+    and only blocks on or above the diagonal are visited, so memory stays O(HASH_CHUNK^2) for any N.
+    :param hashes: uint64 perceptual hashes
+    :param groups: group of every hash
+    :param max_distance: maximal Hamming distance of near-duplicates
+    :return: list of (index, other index, distance) with index < other index
+    """
+    hashes = np.ascontiguousarray(hashes, dtype=np.uint64)
+    groups = np.asarray(groups)
+    pairs: List[Tuple[int, int, int]] = list()
+    for row_start in range(0, len(hashes), HASH_CHUNK):
+        rows = np.arange(row_start, min(row_start + HASH_CHUNK, len(hashes)))
+        for col_start in range(row_start, len(hashes), HASH_CHUNK):
+            cols = np.arange(col_start, min(col_start + HASH_CHUNK, len(hashes)))
+            distance = hamming_distance(hashes[rows, np.newaxis], hashes[cols])
+            mask = (distance <= max_distance) & (
+                groups[rows, np.newaxis] != groups[cols]
+            )
+            mask &= rows[:, np.newaxis] < cols
+            for i, j in zip(*np.nonzero(mask)):
+                pairs.append((int(rows[i]), int(cols[j]), int(distance[i, j])))
+    return pairs
@@ -1,69 +1,293 @@
 """Processing for single image in the DB"""
-from typing import Tuple
+import io
+import os
+import struct
+from typing import BinaryIO, Optional, Tuple, Union
 
 import cv2
 import numpy as np
+from app.image_collection import is_raw, split_frame
+from app.si_cf_kernel import SI_CF_BACKEND, SiCfBackend, fused_sums, resolve_backend
+
+TILE_ROWS = int(os.getenv("TILE_ROWS", 0))
+DECODE_SCALE = int(os.getenv("DECODE_SCALE", 1))
+MIN_DECODE_ROWS = int(os.getenv("MIN_DECODE_ROWS", 540))
+
+READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start of frame markers, which carry image size (DHT, JPG and DAC markers are excluded)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
 
 
 class ImageMetricsInputError(Exception):
     """Image Metrics Error raised on wrong input params"""
 
 
+def read_raw(path: str) -> np.ndarray:
+    """
+    Maps raw image or single frame of raw stack stored in .npy file, pixels are read lazily on access
+    :param path: path to .npy file with H x W x 3 image or "file.npy#index" frame of N x H x W x 3 stack
+    :return: read-only memory mapped uint8 view of the image
+    """
+    filename, index = split_frame(path)
+    try:
+        array = np.load(filename, mmap_mode="r")
+        return array if index is None else array[index]
+    except (OSError, ValueError, IndexError) as err:
+        raise ImageMetricsInputError(f"Raw image could not be read '{path}': {err}")
+
+
+def read_image_size(img_filename: str) -> Optional[Tuple[int, int]]:
+    """
+    Reads size of PNG, JPEG or raw image from its header without decoding pixels
+    :param img_filename: path and filename of the image file
+    :return: tuple of rows and columns, None for other formats or unreadable header
+    """
+    if is_raw(img_filename):
+        try:
+            rows, cols = read_raw(img_filename).shape[:2]
+            return rows, cols
+        except (ImageMetricsInputError, ValueError):
+            return None
+    try:
+        with open(img_filename, "rb") as f:
+            return _read_header_size(f)
+    except OSError:
+        return None
+
+
+def _read_header_size(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """
+    Reads size of PNG or JPEG image from header of opened file
+    :param f: binary stream positioned at the start of the image file
+    :return: tuple of rows and columns, None for other formats or unreadable header
+    """
+    try:
+        head = f.read(24)
+        if head[:8] == PNG_SIGNATURE and head[12:16] == b"IHDR":
+            cols, rows = struct.unpack(">II", head[16:24])
+            return rows, cols
+        if head[:2] != b"\xff\xd8":
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                return None
+            length = struct.unpack(">H", marker[2:])[0]
+            if marker[1] in JPEG_SOF_MARKERS:
+                rows, cols = struct.unpack(">xHH", f.read(5))
+                return rows, cols
+            f.seek(length - 2, os.SEEK_CUR)
+    except struct.error:
+        return None
+
+
 class ImageMetrics:
     """Class for calculating metrics for single image in the database"""
 
-    def __init__(self, img_filename: str) -> None:
+    def __init__(
+        self,
+        img_filename: Union[str, np.ndarray],
+        tile_rows: int = TILE_ROWS,
+        decode_scale: int = DECODE_SCALE,
+        data: Optional[bytes] = None,
+        backend: SiCfBackend = SI_CF_BACKEND,
+    ) -> None:
         """
         Create ImageMetrics for specific image file
-        :param img_filename: path and filename of the image file
+        Raw images (.npy files, their frames and arrays) are used as zero-copy views without decoding.
+        :param img_filename: path and filename of the image file or H x W x 3 uint8 array, e.g. np.memmap frame
+        :param tile_rows: height of horizontal strips in which metrics are accumulated, 0 means whole image
+        :param decode_scale: maximal reduction factor of the decoded image (1, 2, 4 or 8), 1 means full resolution
+        :param data: content of the image file if already read, it is decoded from memory instead of reading the file
+        :param backend: SI and CF calculation method, fused backend falls back to OpenCV without Numba
         """
+        self.backend = resolve_backend(backend)
+        if isinstance(img_filename, np.ndarray) or (
+            isinstance(img_filename, str) and is_raw(img_filename)
+        ):
+            self.__init_raw(img_filename, tile_rows)
+            return
         if not isinstance(img_filename, str) or not len(img_filename):
             raise ImageMetricsInputError("Provide valid filename")
-        self.img = cv2.imread(img_filename)
+        if tile_rows < 0:
+            raise ImageMetricsInputError(
+                f"Tile rows must not be negative '{tile_rows}'"
+            )
+        if decode_scale not in READ_FLAGS:
+            raise ImageMetricsInputError(
+                f"Decode scale must be one of {list(READ_FLAGS)} '{decode_scale}'"
+            )
+        size = None
+        if decode_scale > 1:
+            size = (
+                read_image_size(img_filename)
+                if data is None
+                else _read_header_size(io.BytesIO(data))
+            )
+        self.scale = self.__reduction(size, decode_scale)
+        if data is None:
+            self.img = cv2.imread(img_filename, READ_FLAGS[self.scale])
+        else:
+            self.img = cv2.imdecode(
+                np.frombuffer(data, np.uint8), READ_FLAGS[self.scale]
+            )
         if self.img is None:
             raise ImageMetricsInputError("Loaded image is None")
+        self.tile_rows = tile_rows
+
+    def __init_raw(self, img: Union[str, np.ndarray], tile_rows: int) -> None:
+        """
+        Uses raw image without decoding, raw images are always processed at full resolution
+        :param img: path to raw image or the image array
+        :param tile_rows: height of horizontal strips in which metrics are accumulated, 0 means whole image
+        """
+        if tile_rows < 0:
+            raise ImageMetricsInputError(
+                f"Tile rows must not be negative '{tile_rows}'"
+            )
+        self.img = read_raw(img) if isinstance(img, str) else img
+        if (
+            self.img.dtype != np.uint8
+            or self.img.ndim != 3
+            or self.img.shape[2] != 3
+            or not self.img.shape[0] * self.img.shape[1]
+        ):
+            raise ImageMetricsInputError(
+                f"Raw image must be non empty uint8 array of shape H x W x 3 '{self.img.shape}'"
+            )
+        self.scale = 1
+        self.tile_rows = tile_rows
+
+    @staticmethod
+    def __reduction(size: Optional[Tuple[int, int]], decode_scale: int) -> int:
+        """
+        Chooses reduction factor based on image header, so the decoded image keeps at least MIN_DECODE_ROWS
+        rows and small images are decoded at full resolution. Images of unknown size are not reduced.
+        :param size: rows and columns read from image header, None if unknown
+        :param decode_scale: maximal reduction factor
+        :return: reduction factor
+        """
+        if size is None:
+            return 1
+        scale = decode_scale
+        while scale > 1 and size[0] // scale < MIN_DECODE_ROWS:
+            scale //= 2
+        return scale
 
     def calculate_si_cf(self) -> Tuple[float, float]:
         """
         Calculates both Spatial Information and Colorfulnes for input image
+        Both metrics are accumulated strip by strip, so float buffers are bounded by the strip size
+        and the results match whole image computation. Fused backend computes sums of each strip
+        in one pass over its pixels.
         :return: tuple of SI and CF
         """
-        si = self.__calculate_spatial_information()
-        cf = self.__calculate_colorfulness()
+        rows = self.img.shape[0]
+        tile_rows = self.tile_rows if self.tile_rows > 0 else rows
+        sobel = np.zeros(3)
+        moments = np.zeros((2, 2))
+        for start in range(0, rows, tile_rows):
+            stop = min(start + tile_rows, rows)
+            if self.backend == SiCfBackend.FUSED:
+                strip_sobel, strip_moments = fused_sums(self.img, start, stop)
+            else:
+                strip_sobel = self.__strip_sobel(start, stop)
+                strip_moments = self.__strip_opponent_moments(start, stop)
+            sobel += strip_sobel
+            moments += strip_moments
+
+        si = self.__calculate_spatial_information(sobel)
+        cf = self.__calculate_colorfulness(moments)
         return si, cf
 
-    def __calculate_spatial_information(self) -> float:
+    def __strip_sobel(self, start: int, stop: int) -> np.ndarray:
+        """
+        Calculates per channel sum of squared Sobel gradients for rows [start, stop)
+        Strip is extended by one row on each side (if available), so the 3x3 Sobel sees the same
+        neighbourhood as for the whole image. All channels are processed at once and gradients are kept
+        in float32. Gradients of uint8 images are integers not greater than 1020 in magnitude, so they
+        and their squares are exact in float32, while sums are accumulated in float64.
+        :param start: first row of the strip
+        :param stop: row after the last row of the strip
+        :return: array of per channel sums
+        """
+        top = max(start - 1, 0)
+        bottom = min(stop + 1, self.img.shape[0])
+        strip = self.img[top:bottom]
+        inner = slice(start - top, stop - top)
+        gradient = cv2.Sobel(strip, cv2.CV_32F, 1, 0, ksize=3)
+        sobel = self.__sum_of_squares(gradient[inner])
+        cv2.Sobel(strip, cv2.CV_32F, 0, 1, dst=gradient, ksize=3)
+        sobel += self.__sum_of_squares(gradient[inner])
+        return sobel
+
+    @staticmethod
+    def __sum_of_squares(gradient: np.ndarray) -> np.ndarray:
+        """
+        Squares gradient in place and sums it per channel, so no additional image is allocated
+        :param gradient: float32 gradient image, overwritten
+        :return: array of per channel sums
+        """
+        cv2.multiply(gradient, gradient, dst=gradient)
+        return np.array(cv2.sumElems(gradient)[:3])
+
+    def __strip_opponent_moments(self, start: int, stop: int) -> np.ndarray:
+        """
+        Calculates sums and sums of squares of opponent channels for rows [start, stop)
+        Opponent channels rg = R - G and 2 * yb = R + G - 2 * B of uint8 image are integers, so they are
+        stored in single two channel int16 image, whose means and standard deviations are computed
+        in one pass with float64 accumulation.
+        :param start: first row of the strip
+        :param stop: row after the last row of the strip
+        :return: array [[sum_rg, sum_sq_rg], [sum_yb, sum_sq_yb]]
+        """
+        strip = self.img[start:stop]
+        blue, green, red = (strip[:, :, c] for c in range(3))
+        opponent = np.empty(strip.shape[:2] + (2,), np.int16)
+        rg, yb = opponent[:, :, 0], opponent[:, :, 1]
+        np.subtract(red, green, out=rg, dtype=np.int16)
+        np.add(red, green, out=yb, dtype=np.int16)
+        np.subtract(yb, blue, out=yb)
+        np.subtract(yb, blue, out=yb)
+
+        mean, std = cv2.meanStdDev(opponent)
+        mean = mean.ravel() * (1.0, 0.5)
+        std = std.ravel() * (1.0, 0.5)
+        pixels = strip.shape[0] * strip.shape[1]
+        return pixels * np.vstack((mean, std ** 2 + mean ** 2)).T
+
+    def __calculate_spatial_information(self, sobel: np.ndarray) -> float:
         """
         Calculates spatial information for input image
+        Resolution normalization uses the height of the decoded image, so for reduced decode it accounts
+        for the smaller image the gradients were computed on.
+        :param sobel: per channel sums of squared Sobel gradients of the whole image
         :return: Spatial Information value
         """
-        si_rgb = [0] * 3
-        for d in range(self.img.shape[2]):
-            sobelx = cv2.Sobel(self.img[:, :, d], cv2.CV_64F, 1, 0, ksize=3)
-            sobely = cv2.Sobel(self.img[:, :, d], cv2.CV_64F, 0, 1, ksize=3)
-            sobel = sobelx ** 2 + sobely ** 2
-            si_rgb[d] = np.sqrt(self.img.shape[0] / 1080.0) * np.sqrt(
-                np.sum(sobel) / (self.img.shape[0] * self.img.shape[1])
-            )
+        rows, cols = self.img.shape[:2]
+        si_bgr = np.sqrt(rows / 1080.0) * np.sqrt(sobel / (rows * cols))
 
-        si = 0.299 * si_rgb[2] + 0.587 * si_rgb[1] + 0.114 * si_rgb[0]
+        si = 0.299 * si_bgr[2] + 0.587 * si_bgr[1] + 0.114 * si_bgr[0]
         return si
 
-    def __calculate_colorfulness(self) -> float:
+    def __calculate_colorfulness(self, moments: np.ndarray) -> float:
         """
         Calculates Colorfulness for input image
+        :param moments: sums and sums of squares of opponent channels of the whole image
         :return: Colorfulness value
         """
-        rg = self.img[:, :, 2].astype("float") - self.img[:, :, 1].astype("float")
-        yb = 0.5 * (
-            self.img[:, :, 2].astype("float") + self.img[:, :, 1].astype("float")
-        ) - self.img[:, :, 0].astype("float")
-
-        sigma_rg = np.std(rg)
-        sigma_yb = np.std(yb)
-
-        mu_rg = np.mean(rg)
-        mu_yb = np.mean(yb)
+        pixels = self.img.shape[0] * self.img.shape[1]
+        mu_rg, mu_yb = moments[:, 0] / pixels
+        sigma_rg, sigma_yb = np.sqrt(
+            np.maximum(moments[:, 1] / pixels - moments[:, 0] ** 2 / pixels ** 2, 0.0)
+        )
         cf = np.sqrt(sigma_rg ** 2 + sigma_yb ** 2) + 0.3 * np.sqrt(
             mu_rg ** 2 + mu_yb ** 2
         )
@@ -0,0 +1,281 @@
+"""Parallel processing of image metrics for images from multiple DBs"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+from app.image_collection import is_raw
+from app.image_dedup import unique_files
+from app.image_metrics import DECODE_SCALE, ImageMetrics, ImageMetricsInputError
+from app.instrumentation import Progress, recorder
+
+PREFETCH_THREADS = int(os.getenv("PREFETCH_THREADS", 0))
+PREFETCH_QUEUE = int(os.getenv("PREFETCH_QUEUE", 32))
+DEDUP = os.getenv("DEDUP", "0") == "1"
+
+
+class ImageRecord(NamedTuple):
+    """
+    Metrics of single image together with size of the processed image and processing time.
+    Wall and CPU times cover decoding and calculation, decode times cover only reading and decoding.
+    Times are NaN unless timing is requested or instrumentation is enabled.
+    """
+
+    si: float
+    cf: float
+    rows: int
+    cols: int
+    seconds: float
+    cpu_seconds: float
+    decode_seconds: float
+    decode_cpu_seconds: float
+
+
+def _init_worker() -> None:
+    """Limits OpenCV threads in worker, parallelism is provided by the pool itself"""
+    cv2.setNumThreads(1)
+
+
+def _calculate_record(
+    image: str,
+    decode_scale: int = DECODE_SCALE,
+    data: Optional[bytes] = None,
+    timed: bool = False,
+) -> ImageRecord:
+    """
+    Calculates SI and CF for single image, runs inside worker process or thread
+    :param image: path to the image
+    :param decode_scale: maximal reduction factor of the decoded image
+    :param data: already read content of the image file
+    :param timed: whether decoding and calculation should be timed, times are NaN otherwise
+    :return: image record with SI, CF, size of decoded image and time of decoding and calculation
+    """
+    try:
+        if not timed:
+            im = ImageMetrics(image, decode_scale=decode_scale, data=data)
+            si, cf = im.calculate_si_cf()
+            rows, cols = im.img.shape[:2]
+            nan = float("nan")
+            return ImageRecord(si, cf, rows, cols, nan, nan, nan, nan)
+        start = time.perf_counter()
+        start_cpu = time.thread_time()
+        im = ImageMetrics(image, decode_scale=decode_scale, data=data)
+        decoded = time.perf_counter()
+        decoded_cpu = time.thread_time()
+        si, cf = im.calculate_si_cf()
+        rows, cols = im.img.shape[:2]
+        return ImageRecord(
+            si,
+            cf,
+            rows,
+            cols,
+            time.perf_counter() - start,
+            time.thread_time() - start_cpu,
+            decoded - start,
+            decoded_cpu - start_cpu,
+        )
+    except ImageMetricsInputError as err:
+        raise ImageMetricsInputError(f"Error during processing '{image}': {err}")
+    except Exception as err:
+        raise ImageMetricsInputError(f"Error during processing '{image}': {err!r}")
+
+
+class ImageMetricsPool:
+    """Calculates SI and CF for list of images using pool of worker processes"""
+
+    def __init__(
+        self,
+        workers: int = 1,
+        decode_scale: int = DECODE_SCALE,
+        prefetch: int = PREFETCH_THREADS,
+        queue_size: int = PREFETCH_QUEUE,
+        dedup: bool = DEDUP,
+        timed: bool = False,
+    ) -> None:
+        """
+        Creates image metrics pool
+        :param workers: number of worker processes, 0 means all available cores, 1 runs serially
+        :param decode_scale: maximal reduction factor of decoded images, 1 means full resolution
+        :param prefetch: number of threads reading image files ahead of computation, 0 disables prefetching
+        :param queue_size: maximal number of read files waiting for computation
+        :param dedup: whether byte-identical files should be calculated only once, every file is stat-ed first,
+            which is slow on network storage
+        :param timed: whether images should be timed even when instrumentation is disabled
+        """
+        if workers < 0 or prefetch < 0:
+            raise ImageMetricsInputError(
+                f"Number of workers and prefetch threads must not be negative '{workers}', '{prefetch}'"
+            )
+        if queue_size < 1:
+            raise ImageMetricsInputError(
+                f"Prefetch queue size must be positive '{queue_size}'"
+            )
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.decode_scale = decode_scale
+        self.prefetch = prefetch
+        self.queue_size = queue_size
+        self.dedup = dedup
+        self.timed = timed
+
+    def calculate_si_cf(self, images: Sequence[str]) -> List[Tuple[float, float]]:
+        """
+        Calculates SI and CF for all images, results keep order of the input list
+        :param images: paths to the images, possibly from many DBs
+        :return: list of tuples of SI and CF
+        """
+        return [(record.si, record.cf) for record in self.calculate_records(images)]
+
+    def calculate_records(self, images: Sequence[str]) -> List[ImageRecord]:
+        """
+        Calculates SI and CF together with image size and processing time for all images
+        :param images: paths to the images, possibly from many DBs
+        :return: list of image records in the same order as images
+        """
+        if not self.dedup or len(images) < 2:
+            return self.__calculate(images)
+
+        unique, inverse = unique_files(images)
+        logging.debug(f"{len(images) - len(unique)} images are duplicates")
+        calculated = self.__calculate([images[i] for i in unique])
+        # Copies share the result, no time was spent on them, unknown if nothing was timed
+        spent = 0.0 if self.__timed() else float("nan")
+        return [
+            (
+                calculated[u]
+                if unique[u] == i
+                else calculated[u]._replace(
+                    seconds=spent,
+                    cpu_seconds=spent,
+                    decode_seconds=spent,
+                    decode_cpu_seconds=spent,
+                )
+            )
+            for i, u in enumerate(inverse)
+        ]
+
+    def __timed(self) -> bool:
+        """
+        :return: whether image records should contain processing times
+        """
+        return self.timed or recorder.enabled
+
+    def __calculate(self, images: Sequence[str]) -> List[ImageRecord]:
+        """
+        Calculates image records of all images serially, in worker processes or in prefetching pipeline
+        :param images: paths to the images
+        :return: list of image records in the same order as images
+        """
+        if self.prefetch > 0 and len(images) > 1:
+            return self.__calculate_prefetched(images)
+
+        calculate = partial(
+            _calculate_record, decode_scale=self.decode_scale, timed=self.__timed()
+        )
+        progress = Progress(len(images))
+        records: List[ImageRecord] = list()
+        if self.workers == 1 or len(images) < 2:
+            for image in images:
+                records.append(calculate(image))
+                progress.update()
+            progress.close()
+            return records
+
+        logging.debug(f"Processing {len(images)} images with {self.workers} workers")
+        chunksize = max(1, len(images) // (self.workers * 4))
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker
+            ) as executor:
+                for record in executor.map(calculate, images, chunksize=chunksize):
+                    records.append(record)
+                    progress.update()
+        except BrokenProcessPool as err:
+            raise ImageMetricsInputError(f"Worker process terminated abruptly: {err}")
+        finally:
+            progress.close()
+        return records
+
+    def __calculate_prefetched(self, images: Sequence[str]) -> List[ImageRecord]:
+        """
+        Calculates SI and CF in threaded producer/consumer pipeline.
+        Reader threads load encoded files into bounded queue, so storage latency is overlapped with
+        computation and at most queue_size files are kept in memory. Worker threads decode images
+        from memory and calculate metrics, OpenCV and NumPy release GIL, so they run in parallel.
+        :param images: paths to the images
+        :return: list of image records in the same order as images
+        """
+        paths: queue.Queue = queue.Queue()
+        for item in enumerate(images):
+            paths.put(item)
+        encoded: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        results: List[Optional[ImageRecord]] = [None] * len(images)
+        errors: List[Exception] = list()
+        failed = threading.Event()
+        progress = Progress(len(images))
+
+        def read() -> None:
+            while not failed.is_set():
+                try:
+                    index, image = paths.get_nowait()
+                except queue.Empty:
+                    return
+                data: Optional[bytes] = None
+                try:
+                    # Raw images are memory mapped, not read ahead
+                    if not is_raw(image):
+                        with open(image, "rb") as f:
+                            data = f.read()
+                except OSError:
+                    pass  # reported by ImageMetrics the same way as without prefetching
+                # Workers stop taking files after failure, so reader must not block on full queue
+                while not failed.is_set():
+                    try:
+                        encoded.put((index, image, data), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+        def compute() -> None:
+            while True:
+                item = encoded.get()
+                if item is None:
+                    return
+                index, image, data = item
+                if failed.is_set():
+                    continue
+                try:
+                    results[index] = _calculate_record(
+                        image, self.decode_scale, data, self.__timed()
+                    )
+                    progress.update()
+                except Exception as err:
+                    errors.append(err)
+                    failed.set()
+
+        logging.debug(
+            f"Processing {len(images)} images with {self.prefetch} reader and {self.workers} worker threads"
+        )
+        readers = [threading.Thread(target=read) for _ in range(self.prefetch)]
+        calculators = [threading.Thread(target=compute) for _ in range(self.workers)]
+        for thread in readers + calculators:
+            thread.start()
+        for thread in readers:
+            thread.join()
+        for _ in calculators:
+            encoded.put(None)
+        for thread in calculators:
+            thread.join()
+        progress.close()
+
+        if errors:
+            raise errors[0]
+        missing = [image for image, result in zip(images, results) if result is None]
+        if missing:
+            raise ImageMetricsInputError(f"Images were not processed: {missing}")
+        return [result for result in results if result is not None]
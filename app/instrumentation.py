@@ -0,0 +1,215 @@
+"""Optional per stage timing and memory instrumentation of the analysis with progress reporting"""
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+INSTRUMENTATION = os.getenv("INSTRUMENTATION", "0") == "1"
+PROGRESS = os.getenv("PROGRESS", "0") == "1"
+
+REPORT_FIELDS = (
+    "stage",
+    "label",
+    "calls",
+    "items",
+    "wall_seconds",
+    "cpu_seconds",
+    "peak_rss_mb",
+)
+
+
+class InstrumentationError(Exception):
+    """Instrumentation Error raised when run report could not be written"""
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and its finished worker processes
+    :return: peak RSS in MiB, NaN if not available on the platform
+    """
+    if resource is None:
+        return float("nan")
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class Stage:
+    """Handle of running stage, number of processed items can be set inside the stage"""
+
+    def __init__(self, items: int) -> None:
+        """
+        Creates stage handle
+        :param items: number of items processed by the stage
+        """
+        self.items = items
+
+
+class StageRecorder:
+    """
+    Thread safe accumulator of wall time, CPU time, peak RSS and item counts per stage and label (usually DB).
+    Disabled recorder does not measure nor store anything.
+    """
+
+    def __init__(self, enabled: bool = INSTRUMENTATION) -> None:
+        """
+        Creates stage recorder
+        :param enabled: whether statistics should be collected
+        """
+        self.enabled = enabled
+        self.stats: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+        self.lock = threading.Lock()
+
+    def add(
+        self, stage: str, label: str, wall: float, cpu: float, items: int = 1
+    ) -> None:
+        """
+        Adds statistics measured elsewhere, e.g. in worker process
+        :param stage: stage name
+        :param label: DB or plot the stage was run for
+        :param wall: wall time in seconds
+        :param cpu: CPU time in seconds
+        :param items: number of processed items
+        """
+        if not self.enabled:
+            return
+        rss = peak_rss_mb()
+        with self.lock:
+            stats = self.stats.setdefault(
+                (stage, label),
+                dict(calls=0, items=0, wall_seconds=0.0, cpu_seconds=0.0),
+            )
+            stats["calls"] += 1
+            stats["items"] += items
+            stats["wall_seconds"] += wall
+            stats["cpu_seconds"] += cpu
+            stats["peak_rss_mb"] = max(stats.get("peak_rss_mb", rss), rss)
+
+    @contextmanager
+    def stage(self, stage: str, label: str = "", items: int = 1) -> Iterator[Stage]:
+        """
+        Measures code block as single call of the stage
+        :param stage: stage name
+        :param label: DB or plot the stage is run for
+        :param items: number of processed items, can be changed through yielded handle
+        :return: stage handle
+        """
+        handle = Stage(items)
+        if not self.enabled:
+            yield handle
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        yield handle
+        self.add(
+            stage,
+            label,
+            time.perf_counter() - wall,
+            time.process_time() - cpu,
+            handle.items,
+        )
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """
+        Collected statistics
+        :return: list of rows with REPORT_FIELDS in order of first occurrence
+        """
+        with self.lock:
+            return [
+                dict(stage=stage, label=label, **stats)
+                for (stage, label), stats in self.stats.items()
+            ]
+
+    def reset(self) -> None:
+        """Drops collected statistics"""
+        with self.lock:
+            self.stats.clear()
+
+    def write_report(self, filename: str) -> None:
+        """
+        Writes run report, CSV for .csv files, JSON otherwise
+        :param filename: path to the report
+        """
+        rows = self.rows()
+        try:
+            with open(filename, "w", newline="") as f:
+                if filename.endswith(".csv"):
+                    writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(rows)
+                else:
+                    json.dump({"stages": rows}, f, indent=2)
+        except OSError as err:
+            raise InstrumentationError(f"Run report could not be written: {err}")
+
+
+recorder = StageRecorder()
+
+
+class Progress:
+    """Live progress line with processing rate and estimated time of arrival"""
+
+    def __init__(
+        self,
+        total: int,
+        enabled: bool = PROGRESS,
+        stream: Optional[TextIO] = None,
+        interval: float = 0.5,
+    ) -> None:
+        """
+        Creates progress line
+        :param total: number of items to process
+        :param enabled: whether progress should be shown
+        :param stream: output stream, stderr by default
+        :param interval: minimal time between updates of the line in seconds
+        """
+        self.total = total
+        self.enabled = enabled and total > 0
+        self.stream = stream if stream is not None else sys.stderr
+        self.interval = interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self.shown = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, count: int = 1) -> None:
+        """
+        Marks items as processed and redraws the line if interval passed
+        :param count: number of processed items
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.done += count
+            now = time.perf_counter()
+            if now - self.shown >= self.interval or self.done == self.total:
+                self.shown = now
+                self.stream.write("\r" + self.line(now - self.start))
+                self.stream.flush()
+
+    def line(self, elapsed: float) -> str:
+        """
+        Formats progress line
+        :param elapsed: time from the start in seconds
+        :return: progress line
+        """
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("nan")
+        return f"{self.done}/{self.total} images, {rate:.1f} images/s, ETA {eta:.0f} s"
+
+    def close(self) -> None:
+        """Finishes progress line"""
+        if self.enabled:
+            self.stream.write("\n")
+            self.stream.flush()
@@ -0,0 +1,182 @@
+"""Persistent cache of SI and CF values calculated for images in the DB"""
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import List, Optional, Sequence, Tuple
+
+from app.image_collection import split_frame
+
+CACHE_FILENAME = ".metrics_cache.sqlite"
+
+
+class MetricsCacheError(Exception):
+    """Metrics Cache Error raised when cache file could not be used"""
+
+
+def file_hash(path: str) -> str:
+    """
+    Calculates content hash of the file
+    :param path: path to the file
+    :return: hex digest of the file content
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MetricsCache:
+    """
+    SQLite based cache of per image SI and CF for single DB.
+    Entries are keyed by path relative to the DB, file size and modification time.
+    Optionally content hash is used to keep entries of files which were only touched.
+    Values calculated from reduced decode are kept in separate table for each reduction factor.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        cache_dir: Optional[str] = None,
+        content_hash: bool = False,
+        decode_scale: int = 1,
+    ) -> None:
+        """
+        Opens (or creates) metrics cache for the DB
+        :param directory: path to the DB
+        :param cache_dir: directory for cache files, created if missing, cache is kept inside DB directory
+            if not given
+        :param content_hash: whether content hash should be checked for files with changed mtime
+        :param decode_scale: maximal reduction factor of decoded images the values were calculated with
+        """
+        self.directory = os.path.abspath(directory)
+        self.content_hash = content_hash
+        self.table = (
+            "metrics" if decode_scale == 1 else f"metrics_reduced_{decode_scale}"
+        )
+        if cache_dir is None:
+            self.filename = os.path.join(self.directory, CACHE_FILENAME)
+        else:
+            dir_hash = hashlib.sha1(self.directory.encode()).hexdigest()[:8]
+            self.filename = os.path.join(
+                cache_dir, f"{os.path.basename(self.directory)}-{dir_hash}.sqlite"
+            )
+        try:
+            if cache_dir is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+            self.connection = sqlite3.connect(self.filename)
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (path TEXT PRIMARY KEY, size INTEGER, "
+                "mtime INTEGER, hash TEXT, si REAL, cf REAL)"
+            )
+        except (OSError, sqlite3.Error) as err:
+            raise MetricsCacheError(
+                f"Cache '{self.filename}' could not be opened: {err}"
+            )
+
+    def __enter__(self) -> "MetricsCache":
+        """Context manager entry"""
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Context manager exit"""
+        self.close()
+
+    def close(self) -> None:
+        """Commits pending changes and closes cache file"""
+        self.connection.commit()
+        self.connection.close()
+
+    def __key(self, image: str) -> str:
+        """
+        Path of the image relative to the DB, so the cache survives moving whole DB
+        :param image: path to the image
+        :return: cache key
+        """
+        return os.path.relpath(os.path.abspath(image), self.directory)
+
+    def get_many(self, images: Sequence[str]) -> List[Optional[Tuple[float, float]]]:
+        """
+        Looks up SI and CF of the images, missing and stale entries are returned as None
+        :param images: paths to the images
+        :return: list of cached SI and CF tuples in the same order as images
+        """
+        entries = {
+            row[0]: row[1:]
+            for row in self.connection.execute(
+                f"SELECT path, size, mtime, hash, si, cf FROM {self.table}"
+            )
+        }
+        results: List[Optional[Tuple[float, float]]] = list()
+        for image in images:
+            key = self.__key(image)
+            stat = os.stat(split_frame(image)[0])
+            entry = entries.get(key)
+            if entry is None:
+                results.append(None)
+                continue
+            size, mtime, content, si, cf = entry
+            if size == stat.st_size and mtime == stat.st_mtime_ns:
+                results.append((si, cf))
+            elif (
+                self.content_hash
+                and size == stat.st_size
+                and content == file_hash(split_frame(image)[0])
+            ):
+                self.connection.execute(
+                    f"UPDATE {self.table} SET mtime = ? WHERE path = ?",
+                    (stat.st_mtime_ns, key),
+                )
+                results.append((si, cf))
+            else:
+                results.append(None)
+        return results
+
+    def put_many(
+        self, images: Sequence[str], si_cf: Sequence[Tuple[float, float]]
+    ) -> None:
+        """
+        Stores SI and CF of the images, stale entries are replaced
+        :param images: paths to the images
+        :param si_cf: SI and CF tuples in the same order as images
+        """
+        rows = list()
+        for image, (si, cf) in zip(images, si_cf):
+            filename = split_frame(image)[0]
+            stat = os.stat(filename)
+            content = file_hash(filename) if self.content_hash else None
+            rows.append(
+                (
+                    self.__key(image),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    content,
+                    float(si),
+                    float(cf),
+                )
+            )
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        self.connection.commit()
+
+    def prune(self, images: Sequence[str]) -> int:
+        """
+        Evicts entries of files which are no longer part of the DB
+        :param images: paths to all current images of the DB
+        :return: number of evicted entries
+        """
+        current = {self.__key(image) for image in images}
+        stale = [
+            row[0]
+            for row in self.connection.execute(f"SELECT path FROM {self.table}")
+            if row[0] not in current
+        ]
+        self.connection.executemany(
+            f"DELETE FROM {self.table} WHERE path = ?", [(key,) for key in stale]
+        )
+        self.connection.commit()
+        if stale:
+            logging.debug(f"Evicted {len(stale)} entries from cache '{self.filename}'")
+        return len(stale)
@@ -0,0 +1,114 @@
+"""Columnar store of per image and per DB results, which can be reloaded without processing images"""
+import os
+import re
+import shutil
+from typing import Dict, Sequence
+
+import numpy as np
+
+IMAGES_TABLE = "images"
+DATABASES_TABLE = "databases"
+SUMMARY_TABLE = "summary"
+HULL_TABLE = "hull"
+IMAGE_COLUMNS = (
+    "db",
+    "file",
+    "si",
+    "cf",
+    "rows",
+    "cols",
+    "seconds",
+    "cpu_seconds",
+    "decode_seconds",
+    "decode_cpu_seconds",
+)
+
+
+class MetricsStoreError(Exception):
+    """Metrics Store Error raised when results could not be stored or loaded"""
+
+
+def column_name(name: str) -> str:
+    """
+    Converts metric name to column (and file) name
+    :param name: metric name, e.g. "Fill rate"
+    :return: column name, e.g. "fill_rate"
+    """
+    return re.sub(r"\W+", "_", name.strip()).lower()
+
+
+class MetricsStore:
+    """
+    Tables stored as directories with one .npy file per column.
+    Numeric columns can be memory mapped, so large tables are loaded lazily.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Creates metrics store
+        :param directory: directory of the store, created on first write
+        """
+        self.directory = directory
+
+    def __table_dir(self, table: str) -> str:
+        """
+        Directory of the table
+        :param table: table name
+        :return: path to the directory
+        """
+        return os.path.join(self.directory, table)
+
+    def exists(self, table: str) -> bool:
+        """
+        Checks whether table was written
+        :param table: table name
+        :return: True if table exists
+        """
+        return os.path.isdir(self.__table_dir(table))
+
+    def write_table(self, table: str, columns: Dict[str, np.ndarray]) -> None:
+        """
+        Writes table, existing table of the same name is replaced
+        :param table: table name
+        :param columns: column name to array mapping, all arrays must have the same length
+        """
+        if len({len(values) for values in columns.values()}) > 1:
+            raise MetricsStoreError(f"Columns of table '{table}' differ in length")
+        table_dir = self.__table_dir(table)
+        tmp_dir = table_dir + ".tmp"
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for name, values in columns.items():
+                np.save(os.path.join(tmp_dir, f"{column_name(name)}.npy"), values)
+            shutil.rmtree(table_dir, ignore_errors=True)
+            os.rename(tmp_dir, table_dir)
+        except OSError as err:
+            raise MetricsStoreError(f"Table '{table}' could not be written: {err}")
+
+    def read_table(
+        self, table: str, mmap: bool = True, required: Sequence[str] = ()
+    ) -> Dict[str, np.ndarray]:
+        """
+        Reads table
+        :param table: table name
+        :param mmap: whether columns should be memory mapped instead of read to memory
+        :param required: columns which must be present, e.g. IMAGE_COLUMNS
+        :return: column name to array mapping
+        """
+        table_dir = self.__table_dir(table)
+        try:
+            columns = {
+                filename[: -len(".npy")]: np.load(
+                    os.path.join(table_dir, filename),
+                    mmap_mode="r" if mmap else None,
+                )
+                for filename in sorted(os.listdir(table_dir))
+                if filename.endswith(".npy")
+            }
+        except (OSError, ValueError) as err:
+            raise MetricsStoreError(f"Table '{table}' could not be read: {err}")
+        missing = [name for name in required if column_name(name) not in columns]
+        if missing:
+            raise MetricsStoreError(f"Table '{table}' is missing columns {missing}")
+        return columns
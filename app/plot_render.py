@@ -0,0 +1,250 @@
+"""
+Rendering of plots described as jobs, which can be executed in parallel and skipped when up to date.
+Plotting libraries (matplotlib, seaborn, pandas) are imported only when plot is rendered,
+so modules creating jobs stay cheap to import.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from app.instrumentation import recorder
+
+PLOT_USETEX = os.getenv("PLOT_USETEX", "1") == "1"
+HASH_KEY = "InputHash"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class PlotRenderError(Exception):
+    """Plot Render Error raised on wrong plot description"""
+
+
+def plot_rc(usetex: bool = PLOT_USETEX) -> Dict[str, Any]:
+    """
+    Style of all plots, applied only for the time of rendering instead of global pyplot state
+    :param usetex: whether text should be rendered with LaTeX
+    :return: dictionary of matplotlib rc params
+    """
+    import seaborn as sns
+    from cycler import cycler
+
+    # Single letter color codes ("k", "r", ...) are not part of rc params, so they are set globally
+    sns.set_color_codes("deep")
+    rc = dict(sns.plotting_context("notebook"))
+    rc.update(sns.axes_style("white"))
+    rc["axes.prop_cycle"] = cycler(color=sns.color_palette("deep"))
+    rc.update(
+        {
+            "font.size": 36,
+            "font.family": "serif",
+            "font.serif": ["Computer Modern"],
+            "text.usetex": usetex,
+        }
+    )
+    return rc
+
+
+def _plot_si_cf_plane(ax, points: np.ndarray) -> None:
+    """Plots Spatial Information x Colorfulness plane"""
+    import seaborn as sns
+
+    sns.scatterplot(x=points[:, 0], y=points[:, 1], ax=ax)
+
+
+def _plot_convex_hull(ax, points: np.ndarray, simplices: np.ndarray) -> None:
+    """Plots Convex Hull for SIxCF plane"""
+    ax.plot(points[:, 0], points[:, 1], "o")
+    for simplex in simplices:
+        ax.plot(points[simplex, 0], points[simplex, 1], "k-")
+
+
+def _plot_fixed_radius(
+    ax, points: np.ndarray, simplices: np.ndarray, radius: float
+) -> None:
+    """Plots Convex Hull with fixed radius method for SIxCF plane"""
+    radius *= 72.0 / ax.figure.dpi
+    ax.plot(points[:, 0], points[:, 1], "o", markersize=radius)
+    ax.plot(points[:, 0], points[:, 1], "yx")
+    for simplex in simplices:
+        ax.plot(points[simplex, 0], points[simplex, 1], "k-")
+
+
+def _plot_delaunay(ax, points: np.ndarray, simplices: np.ndarray) -> None:
+    """Plots Delaunay triangulation for SIxCF plane"""
+    from scipy.spatial import Delaunay
+
+    for simplex in simplices:
+        ax.plot(points[simplex, 0], points[simplex, 1], "r-")
+
+    tri = Delaunay(points)
+    ax.triplot(points[:, 0], points[:, 1], tri.simplices.copy(), lw=1)
+
+
+def _plot_single_bar(ax, labels: List[str], values: List[float], palette) -> None:
+    """Plots bar for single metric"""
+    import seaborn as sns
+
+    sns.barplot(x=labels, y=values, palette=palette, ax=ax)
+
+
+def _plot_double_bar(
+    ax, labels: List[str], metrics: List[str], values: List[float]
+) -> None:
+    """Plots double bar for metric with SI/CF split"""
+    import pandas as pd
+    import seaborn as sns
+
+    df = pd.DataFrame({"DB": labels, "Metric": metrics, "value": values})
+    sns.barplot(x="DB", y="value", hue="Metric", data=df, ax=ax)
+
+
+PLOTTERS: Dict[str, Callable[..., None]] = {
+    "si_cf_plane": _plot_si_cf_plane,
+    "convex_hull": _plot_convex_hull,
+    "fixed_radius": _plot_fixed_radius,
+    "delaunay": _plot_delaunay,
+    "single_bar": _plot_single_bar,
+    "double_bar": _plot_double_bar,
+}
+
+
+class PlotJob:
+    """Description of single figure, which can be rendered later and in other process"""
+
+    def __init__(
+        self,
+        filename: str,
+        kind: str,
+        data: Dict[str, Any],
+        figsize: Tuple[int, int],
+        axes: Dict[str, Any],
+        tight: bool = False,
+    ) -> None:
+        """
+        Creates plot job
+        :param filename: output PNG file
+        :param kind: kind of the plot, key of PLOTTERS
+        :param data: keyword arguments of the plotting function
+        :param figsize: size of the figure in inches
+        :param axes: axes properties set after plotting, e.g. limits, labels and title
+        :param tight: whether tight layout and tight bounding box should be used
+        """
+        if kind not in PLOTTERS:
+            raise PlotRenderError(f"Unknown plot kind '{kind}'")
+        self.filename = filename
+        self.kind = kind
+        self.data = data
+        self.figsize = figsize
+        self.axes = axes
+        self.tight = tight
+
+    def digest(self, usetex: bool = PLOT_USETEX) -> str:
+        """
+        Calculates hash of all inputs of the plot
+        :param usetex: whether text is rendered with LaTeX
+        :return: hex digest
+        """
+        inputs = (self.kind, self.data, self.figsize, self.axes, self.tight, usetex)
+        return hashlib.sha256(pickle.dumps(inputs, protocol=4)).hexdigest()
+
+
+def stored_digest(filename: str) -> Optional[str]:
+    """
+    Reads input hash stored in text chunk of existing PNG file
+    :param filename: PNG file
+    :return: hex digest or None if file does not exist or has no hash
+    """
+    try:
+        with open(filename, "rb") as f:
+            if f.read(8) != PNG_SIGNATURE:
+                return None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                length, chunk_type = struct.unpack(">I4s", header)
+                if chunk_type in (b"IDAT", b"IEND"):
+                    return None
+                data = f.read(length)
+                f.read(4)  # CRC
+                if chunk_type == b"tEXt":
+                    key, _, value = data.partition(b"\0")
+                    if key.decode("latin-1") == HASH_KEY:
+                        return value.decode("latin-1")
+    except OSError:
+        return None
+
+
+def render(job: PlotJob, usetex: bool = PLOT_USETEX) -> bool:
+    """
+    Renders single plot using object-oriented matplotlib API, skips plots whose inputs did not change
+    :param job: plot description
+    :param usetex: whether text should be rendered with LaTeX
+    :return: True if plot was rendered, False if existing file was up to date
+    """
+    digest = job.digest(usetex)
+    if stored_digest(job.filename) == digest:
+        logging.debug(f"Plot '{job.filename}' is up to date")
+        return False
+
+    from matplotlib import rc_context
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    with rc_context(plot_rc(usetex)):
+        fig = Figure(figsize=job.figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        PLOTTERS[job.kind](ax, **job.data)
+        ax.set(**job.axes)
+        if job.tight:
+            fig.tight_layout()
+        fig.savefig(
+            job.filename,
+            bbox_inches="tight" if job.tight else None,
+            metadata={HASH_KEY: digest},
+        )
+    return True
+
+
+def _render_timed(job: PlotJob) -> Tuple[bool, float, float]:
+    """
+    Renders single plot and measures it, runs inside worker process
+    :param job: plot description
+    :return: whether plot was rendered, wall time and CPU time in seconds
+    """
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    rendered = render(job)
+    return rendered, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def render_all(jobs: List[PlotJob], workers: int = 1) -> int:
+    """
+    Renders all plots, optionally in pool of processes
+    :param jobs: plot descriptions
+    :param workers: number of worker processes, 0 means all available cores, 1 renders serially
+    :return: number of rendered plots
+    """
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    # Plots are measured only for instrumentation, otherwise they are just rendered
+    render_job: Callable[[PlotJob], Any] = _render_timed if recorder.enabled else render
+    if workers == 1 or len(jobs) < 2:
+        results = [render_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(render_job, jobs))
+    if not recorder.enabled:
+        return sum(results)
+
+    timed: List[Tuple[bool, float, float]] = results
+    for job, (_, wall, cpu) in zip(jobs, timed):
+        stage = "bar" if job.kind.endswith("bar") else "plot"
+        label = os.path.splitext(os.path.basename(job.filename))[0]
+        recorder.add(stage, label, wall, cpu)
+    return sum(rendered for rendered, _, _ in timed)
@@ -0,0 +1,112 @@
+"""Fused single pass SI and CF kernel, compiled with Numba when it is installed"""
+import logging
+import os
+from enum import Enum
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+
+class SiCfBackend(Enum):
+    """
+    Available SI and CF calculation methods
+    """
+
+    OPENCV = "opencv"
+    FUSED = "fused"
+
+
+SI_CF_BACKEND = SiCfBackend(os.getenv("SI_CF_BACKEND", "opencv"))
+
+
+def _fused_kernel(img: np.ndarray, start: int, stop: int, sums: np.ndarray) -> None:
+    """
+    Accumulates Sobel and opponent channel sums of rows [start, stop) visiting every pixel once
+    All values are integers, so they are accumulated exactly in int64. Neighbours outside of the image
+    are reflected like OpenCV BORDER_REFLECT_101 used by Sobel.
+    :param img: H x W x 3 uint8 BGR image
+    :param start: first row
+    :param stop: row after the last row
+    :param sums: int64 array, [0:3] per channel sums of squared Sobel gradients (B, G, R),
+        [3:7] sums of rg, rg ** 2, 2 * yb and (2 * yb) ** 2
+    """
+    rows, cols = img.shape[0], img.shape[1]
+    for r in range(start, stop):
+        up = abs(r - 1) if rows > 1 else 0
+        down = r + 1 if r + 1 < rows else max(rows - 2, 0)
+        for c in range(cols):
+            left = abs(c - 1) if cols > 1 else 0
+            right = c + 1 if c + 1 < cols else max(cols - 2, 0)
+            for ch in range(3):
+                gx = (
+                    np.int64(img[up, right, ch])
+                    - np.int64(img[up, left, ch])
+                    + 2 * (np.int64(img[r, right, ch]) - np.int64(img[r, left, ch]))
+                    + np.int64(img[down, right, ch])
+                    - np.int64(img[down, left, ch])
+                )
+                gy = (
+                    np.int64(img[down, left, ch])
+                    - np.int64(img[up, left, ch])
+                    + 2 * (np.int64(img[down, c, ch]) - np.int64(img[up, c, ch]))
+                    + np.int64(img[down, right, ch])
+                    - np.int64(img[up, right, ch])
+                )
+                sums[ch] += gx * gx + gy * gy
+            blue = np.int64(img[r, c, 0])
+            green = np.int64(img[r, c, 1])
+            red = np.int64(img[r, c, 2])
+            rg = red - green
+            yb = red + green - 2 * blue
+            sums[3] += rg
+            sums[4] += rg * rg
+            sums[5] += yb
+            sums[6] += yb * yb
+
+
+@lru_cache(maxsize=None)
+def compiled_kernel() -> Optional[Callable[[np.ndarray, int, int, np.ndarray], None]]:
+    """
+    Imports Numba and compiles fused kernel on first use, so OpenCV backend never imports Numba
+    Kernel is compiled for decoded images right away, other array types (e.g. read-only memory maps)
+    are compiled when they are first seen.
+    :return: compiled kernel, None if Numba is not installed
+    """
+    try:
+        import numba
+    except ImportError:  # optional dependency
+        return None
+    kernel = numba.njit(cache=True, nogil=True)(_fused_kernel)
+    kernel(np.zeros((1, 1, 3), np.uint8), 0, 1, np.zeros(7, np.int64))
+    return kernel
+
+
+def resolve_backend(backend: SiCfBackend) -> SiCfBackend:
+    """
+    Falls back to OpenCV backend when fused kernel can not be compiled
+    :param backend: requested backend
+    :return: backend which will be used
+    """
+    if backend == SiCfBackend.FUSED and compiled_kernel() is None:
+        logging.debug("Numba is not installed, using OpenCV SI/CF backend")
+        return SiCfBackend.OPENCV
+    return backend
+
+
+def fused_sums(img: np.ndarray, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates per channel Sobel sums and opponent channel moments of rows [start, stop) in single pass
+    Neighbouring rows outside of the strip are read from the image, so the sums match whole image
+    computation. Without Numba the kernel runs in pure Python, which is only suitable for tiny images.
+    :param img: H x W x 3 uint8 BGR image
+    :param start: first row of the strip
+    :param stop: row after the last row of the strip
+    :return: per channel sums of squared Sobel gradients and array [[sum_rg, sum_sq_rg], [sum_yb, sum_sq_yb]]
+    """
+    sums = np.zeros(7, np.int64)
+    kernel = compiled_kernel() or _fused_kernel
+    kernel(img, start, stop, sums)
+    sobel = sums[:3].astype(float)
+    moments = sums[3:].astype(float).reshape(2, 2) * ((1.0, 1.0), (0.5, 0.25))
+    return sobel, moments
@@ -0,0 +1,83 @@
+"""Spatial index over normalized SI x CF plane for coverage queries on large DBs"""
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+COVERAGE_RADIUS = float(os.getenv("COVERAGE_RADIUS", 0.05))
+COVERAGE_RESOLUTION = int(os.getenv("COVERAGE_RESOLUTION", 256))
+
+
+class SpatialIndex:
+    """
+    KD-tree over normalized (CF, SI) points.
+    Every query is answered in logarithmic time with respect to the number of points,
+    so metrics are evaluated on probe grids of fixed size regardless of the DB size.
+    """
+
+    def __init__(self, points: np.ndarray) -> None:
+        """
+        Builds spatial index
+        :param points: array of normalized (CF, SI) points
+        """
+        self.points = points
+        self.tree = cKDTree(points)
+
+    @staticmethod
+    def __grid(low: np.ndarray, high: np.ndarray, resolution: int) -> np.ndarray:
+        """
+        Creates probe points in the centers of regular grid cells
+        :param low: lower corner of the grid
+        :param high: upper corner of the grid
+        :param resolution: number of cells along each axis
+        :return: array of probe points
+        """
+        step = (high - low) / resolution
+        xs = low[0] + step[0] * (np.arange(resolution) + 0.5)
+        ys = low[1] + step[1] * (np.arange(resolution) + 0.5)
+        return np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+
+    def covered(self, probes: np.ndarray, radius: float) -> np.ndarray:
+        """
+        Checks which probe points have at least one point within radius
+        :param probes: array of probe points
+        :param radius: coverage radius
+        :return: boolean array
+        """
+        distance, _ = self.tree.query(probes, distance_upper_bound=radius)
+        return np.isfinite(distance)
+
+    def nn_coverage(
+        self, radius: float = COVERAGE_RADIUS, resolution: int = COVERAGE_RESOLUTION
+    ) -> float:
+        """
+        Calculates fraction of the unit square whose nearest point is closer than radius
+        :param radius: coverage radius in normalized units
+        :param resolution: number of probe grid cells along each axis
+        :return: coverage [0-1]
+        """
+        probes = self.__grid(np.zeros(2), np.ones(2), resolution)
+        return float(np.mean(self.covered(probes, radius)))
+
+    def union_area(
+        self, radius: float = COVERAGE_RADIUS, resolution: int = COVERAGE_RESOLUTION
+    ) -> float:
+        """
+        Calculates area of union of disks of given radius around all points
+        :param radius: disk radius in normalized units
+        :param resolution: number of probe grid cells along each axis
+        :return: area in normalized units
+        """
+        low = self.points.min(axis=0) - radius
+        high = self.points.max(axis=0) + radius
+        probes = self.__grid(low, high, resolution)
+        return float(np.mean(self.covered(probes, radius)) * np.prod(high - low))
+
+    def point_density(self, radius: float = COVERAGE_RADIUS) -> float:
+        """
+        Calculates mean number of other points within radius around each point
+        :param radius: neighbourhood radius in normalized units
+        :return: mean number of neighbours
+        """
+        pairs = self.tree.count_neighbors(self.tree, radius)
+        return (pairs - len(self.points)) / len(self.points)
@@ -0,0 +1,236 @@
+"""Benchmarks of image metrics and coverage hot paths on synthetic data, results are stored as JSON"""
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from app.database_analyze import DatabaseAnalyze
+from app.database_metrics import DatabaseMetrics
+from app.fill_rate import FillRateBackend
+from app.image_metrics import ImageMetrics
+
+LOGGING_LEVEL = int(os.getenv("LOGGING_LEVEL", logging.WARNING))
+
+logging.basicConfig(level=LOGGING_LEVEL)
+
+BENCH_OUTPUT = os.getenv("BENCH_OUTPUT", "./bench_results.json")
+BENCH_BASELINE = os.getenv("BENCH_BASELINE") or None
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 1.25))
+BENCH_REPEAT = int(os.getenv("BENCH_REPEAT", 3))
+BENCH_QUICK = os.getenv("BENCH_QUICK", "0") == "1"
+
+IMAGE_SIZES = [(512, 512), (1080, 1920), (2160, 3840), (4320, 7680)]
+DB_SIZES = [10, 100, 1000, 10000, 100000]
+ANALYZE_DBS = 3
+ANALYZE_IMAGES = 10
+
+
+def synthetic_image(rows: int, cols: int, seed: int = 0) -> np.ndarray:
+    """
+    Creates image with smooth color gradients, edges and noise, so both SI and CF are non trivial
+    :param rows: image height
+    :param cols: image width
+    :param seed: random seed
+    :return: BGR uint8 image
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:rows, 0:cols].astype(np.float32)
+    img = np.stack(
+        (
+            127 + 100 * np.sin(x / cols * 6 + seed),
+            127 + 100 * np.cos(y / rows * 4),
+            255 * ((x // 64 + y // 64) % 2),
+        ),
+        axis=-1,
+    )
+    img += rng.normal(0, 12, img.shape).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def synthetic_si_cf(points: int, seed: int = 0) -> Tuple[List[float], List[float]]:
+    """
+    Creates point cloud resembling SI x CF plane of a DB
+    :param points: number of images
+    :param seed: random seed
+    :return: tuple of SI and CF lists
+    """
+    rng = np.random.default_rng(seed)
+    si = np.clip(rng.normal(60, 25, points), 1, 170)
+    cf = np.clip(rng.gamma(4, 12, points), 1, 165)
+    return si.tolist(), cf.tolist()
+
+
+def measure(func: Callable[[], Any], repeat: int = BENCH_REPEAT) -> Dict[str, float]:
+    """
+    Measures wall time of repeated calls and peak of memory traced by tracemalloc (includes NumPy arrays,
+    but not buffers allocated inside OpenCV) in separate call, so tracing does not affect timing
+    :param func: benchmarked function
+    :param repeat: number of timed calls
+    :return: dictionary with best and mean time in seconds and peak memory in MiB
+    """
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "mean_seconds": float(np.mean(times)),
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+
+
+def bench_image_metrics(tmp: str) -> List[Dict[str, Any]]:
+    """
+    Benchmarks SI and CF calculation including decode for increasing image sizes
+    :param tmp: directory for synthetic images
+    :return: list of results
+    """
+    results = list()
+    for rows, cols in IMAGE_SIZES[:2] if BENCH_QUICK else IMAGE_SIZES:
+        filename = os.path.join(tmp, f"image_{rows}x{cols}.png")
+        cv2.imwrite(
+            filename, synthetic_image(rows, cols), [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        )
+        result = measure(lambda: ImageMetrics(filename).calculate_si_cf())
+        results.append(
+            {"name": "image_metrics", "params": {"rows": rows, "cols": cols}, **result}
+        )
+    return results
+
+
+def bench_database_metrics() -> List[Dict[str, Any]]:
+    """
+    Benchmarks DatabaseMetrics construction, fill rate and coverage area for increasing DB sizes
+    :return: list of results
+    """
+    results = list()
+    for points in DB_SIZES[:3] if BENCH_QUICK else DB_SIZES:
+        si_cf = synthetic_si_cf(points)
+        max_si_cf = (max(si_cf[0]), max(si_cf[1]))
+        params = {"points": points}
+
+        def create() -> DatabaseMetrics:
+            return DatabaseMetrics("", None, max_si_cf, "bench", si_cf)
+
+        dm = create()
+        benchmarks: Dict[str, Callable[[], Any]] = {
+            "database_metrics_init": create,
+            "coverage_area": dm.get_coverage_area,
+        }
+        for backend in FillRateBackend:
+            benchmarks[f"fill_rate_{backend.value}"] = (
+                lambda b=backend: dm.calculate_fill_rate_fixed_radius_area(backend=b)
+            )
+        for name, func in benchmarks.items():
+            results.append({"name": name, "params": params, **measure(func)})
+    return results
+
+
+def bench_database_analyze(tmp: str) -> List[Dict[str, Any]]:
+    """
+    Benchmarks whole analysis (without plots) of several synthetic DBs
+    :param tmp: directory for synthetic DBs
+    :return: list of results
+    """
+    parent = os.path.join(tmp, "dbs") + "/"
+    for d in range(ANALYZE_DBS):
+        os.makedirs(parent + f"db{d}")
+        for i in range(ANALYZE_IMAGES):
+            cv2.imwrite(
+                parent + f"db{d}/{i}.png", synthetic_image(512, 512, d * 100 + i)
+            )
+
+    def analyze() -> None:
+        DatabaseAnalyze(parent, None, plots=False).analyze()
+
+    params = {"dbs": ANALYZE_DBS, "images": ANALYZE_IMAGES, "rows": 512, "cols": 512}
+    return [{"name": "database_analyze", "params": params, **measure(analyze)}]
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """
+    Compares results with baseline results of the same benchmarks
+    :param results: current results
+    :param baseline: results of previous release
+    :param tolerance: allowed ratio of current and baseline time
+    :return: descriptions of regressions
+    """
+    previous = {
+        (r["name"], json.dumps(r["params"], sort_keys=True)): r for r in baseline
+    }
+    regressions = list()
+    for result in results:
+        base = previous.get(
+            (result["name"], json.dumps(result["params"], sort_keys=True))
+        )
+        if base is None:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        if ratio > tolerance:
+            regressions.append(
+                f"{result['name']} {result['params']}: {base['seconds']:.4f}s -> {result['seconds']:.4f}s "
+                f"({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def run(baseline_file: Optional[str] = BENCH_BASELINE) -> Dict[str, Any]:
+    """
+    Runs all benchmarks
+    :param baseline_file: JSON file with results of previous release to compare with
+    :return: dictionary with environment description, results and regressions
+    """
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    try:
+        results = bench_image_metrics(tmp)
+        results += bench_database_metrics()
+        results += bench_database_analyze(tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    regressions: List[str] = list()
+    if baseline_file is not None:
+        with open(baseline_file, "r") as f:
+            regressions = compare(results, json.load(f)["results"], BENCH_TOLERANCE)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "regressions": regressions,
+    }
+
+
+if __name__ == "__main__":
+    report = run()
+    with open(BENCH_OUTPUT, "w") as f:
+        json.dump(report, f, indent=2)
+    for r in report["results"]:
+        logging.info(
+            f"{r['name']} {r['params']}: {r['seconds']:.4f}s, {r['peak_memory_mb']:.1f} MiB"
+        )
+    for regression in report["regressions"]:
+        logging.warning(f"Performance regression: {regression}")
+    sys.exit(1 if report["regressions"] else 0)
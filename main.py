@@ -1,8 +1,16 @@
-"""Runs analysis for several databases provided in DB_SRC env var and stores results in OUTPUT dir"""
+"""
+Runs analysis for several databases provided in DB_SRC env var and stores results in OUTPUT dir.
+Subcommand "metrics" only calculates SI and CF of a single DB, it does not import plotting libraries,
+so it starts quickly in short lived workers and containers.
+"""
+import argparse
+import csv
 import logging
 import os
+import sys
+from typing import Optional
 
-from app.database_analyze import DatabaseAnalyze
+from app.instrumentation import recorder
 
 LOGGING_LEVEL = int(os.getenv("LOGGING_LEVEL", logging.WARNING))
 
@@ -10,7 +18,144 @@ logging.basicConfig(level=LOGGING_LEVEL)
 
 DB_SRC = os.getenv("DB_SRC", "./example_dataset/")
 OUTPUT = os.getenv("OUTPUT", "./output/")
+WORKERS = int(os.getenv("WORKERS", 1))
+METRICS_CACHE = os.getenv("METRICS_CACHE", "0") == "1"
+CACHE_DIR = os.getenv("CACHE_DIR") or None
+PLOTS = os.getenv("PLOTS", "1") == "1"
+DECODE_SCALE = int(os.getenv("DECODE_SCALE", 1))
+DECODE_ERROR_REPORT = os.getenv("DECODE_ERROR_REPORT", "0") == "1"
+NEAR_DUPLICATE_REPORT = os.getenv("NEAR_DUPLICATE_REPORT", "0") == "1"
+STORE = os.getenv("STORE") or None
+FROM_STORE = os.getenv("FROM_STORE", "0") == "1"
+RUN_REPORT = os.getenv("RUN_REPORT") or OUTPUT + "run_report.json"
 
-if __name__ == "__main__":
-    da = DatabaseAnalyze(DB_SRC, OUTPUT)
+
+def analyze(
+    store: Optional[str] = STORE,
+    from_store: bool = FROM_STORE,
+    summary_only: bool = False,
+) -> None:
+    """
+    Runs full analysis of all DBs with plots
+    :param store: directory of columnar store
+    :param from_store: whether per image results should be loaded from store
+    :param summary_only: whether only metrics of DB summaries in store should be analyzed
+    """
+    from app.database_analyze import DatabaseAnalyze
+
+    decode_error_report = DECODE_ERROR_REPORT
+    if decode_error_report and DECODE_SCALE == 1:
+        logging.warning(
+            "DECODE_ERROR_REPORT requires DECODE_SCALE greater than 1, report is skipped"
+        )
+        decode_error_report = False
+    near_duplicate_report = NEAR_DUPLICATE_REPORT
+    if summary_only and (decode_error_report or near_duplicate_report):
+        logging.warning(
+            "Summary only analysis does not load images, decode error and near-duplicate reports are skipped"
+        )
+        decode_error_report = near_duplicate_report = False
+    da = DatabaseAnalyze(
+        DB_SRC,
+        OUTPUT,
+        WORKERS,
+        METRICS_CACHE,
+        CACHE_DIR,
+        PLOTS,
+        DECODE_SCALE,
+        store,
+        from_store,
+        summary_only,
+    )
     da.analyze()
+    if decode_error_report:
+        report = da.decode_error()
+        logging.info(f"Error of reduced decode against full resolution:\n{report}")
+        report.to_csv(OUTPUT + "decode_error.csv")
+    if near_duplicate_report:
+        duplicates = da.near_duplicates()
+        overlap = duplicates.groupby(["DB", "Other DB"]).size()
+        logging.info(f"Near-duplicate images shared by DBs:\n{overlap}")
+        duplicates.to_csv(OUTPUT + "near_duplicates.csv", index=False)
+    if recorder.enabled:
+        recorder.write_report(RUN_REPORT)
+        logging.info(f"Run report stored in {RUN_REPORT}")
+
+
+def metrics(db_dir: str, output: Optional[str] = None) -> None:
+    """
+    Calculates SI and CF of all images in single DB and writes them as CSV
+    :param db_dir: path to the DB
+    :param output: CSV file, standard output if not given
+    """
+    from app.image_collection import ImageCollection
+    from app.image_metrics_pool import ImageMetricsPool
+
+    images = list(ImageCollection(db_dir))
+    records = ImageMetricsPool(WORKERS, DECODE_SCALE).calculate_records(images)
+    f = open(output, "w", newline="") if output else sys.stdout
+    try:
+        writer = csv.writer(f)
+        writer.writerow(("file", "si", "cf", "rows", "cols"))
+        for image, record in zip(images, records):
+            writer.writerow((image, record.si, record.cf, record.rows, record.cols))
+    finally:
+        if output:
+            f.close()
+
+
+def shard(store: str, index: int, count: int) -> None:
+    """
+    Calculates SI and CF of single shard of all DBs and writes partial results to shared store
+    :param store: directory of the store shared by all shards
+    :param index: index of the shard
+    :param count: number of shards
+    """
+    from app.database_shard import analyze_shard
+
+    images = analyze_shard(DB_SRC, store, index, count, WORKERS, DECODE_SCALE)
+    logging.info(f"Shard {index} of {count} processed {images} images")
+
+
+def merge(store: str, count: int, summary_only: bool = False) -> None:
+    """
+    Merges partial results of all shards and runs analysis from the merged store
+    :param store: directory of the store shared by all shards
+    :param count: number of shards
+    :param summary_only: whether only area, ranges and uniformity should be analyzed from merged DB summaries
+    """
+    from app.database_shard import merge_shards
+
+    merge_shards(store, count)
+    analyze(store, from_store=True, summary_only=summary_only)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("analyze", help="analyze all DBs in DB_SRC (default)")
+    metrics_parser = commands.add_parser("metrics", help="calculate SI and CF of DB")
+    metrics_parser.add_argument("db_dir", help="path to the DB")
+    metrics_parser.add_argument("-o", "--output", help="CSV file, stdout by default")
+    shard_parser = commands.add_parser("shard", help="calculate SI and CF of shard")
+    shard_parser.add_argument("index", type=int, help="index of the shard")
+    merge_parser = commands.add_parser("merge", help="merge shards and analyze")
+    merge_parser.add_argument(
+        "--summary-only",
+        action="store_true",
+        help="analyze only DB summaries, per image results are not loaded",
+    )
+    for sharded in (shard_parser, merge_parser):
+        sharded.add_argument("count", type=int, help="number of shards")
+        sharded.add_argument("--store", default=STORE, help="shared store directory")
+    args = parser.parse_args()
+    if args.command == "metrics":
+        metrics(args.db_dir, args.output)
+    elif args.command in ("shard", "merge") and args.store is None:
+        parser.error("sharded analysis requires STORE env var or --store")
+    elif args.command == "shard":
+        shard(args.store, args.index, args.count)
+    elif args.command == "merge":
+        merge(args.store, args.count, args.summary_only)
+    else:
+        analyze()
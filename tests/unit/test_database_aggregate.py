@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+import numpy as np
+from app.database_aggregate import DatabaseAggregate, DatabaseAggregateError
+from app.database_metrics import DatabaseMetrics
+from app.database_summary import DatabaseSummary
+
+
+class TestDatabaseAggregate(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.dbs = ["a", "b", "c"]
+        self.si_cf = {
+            db: (list(rng.uniform(1, 100, n)), list(rng.uniform(1, 80, n)))
+            for db, n in zip(self.dbs, (5, 10, 20))
+        }
+
+    def test_should_give_same_metrics_as_database_metrics(self):
+        aggregate = DatabaseAggregate.from_si_cf(self.dbs, self.si_cf)
+        max_si_cf = aggregate.get_max_si_cf()
+        self.assertEqual(
+            max_si_cf,
+            (
+                max(max(si) for si, _ in self.si_cf.values()),
+                max(max(cf) for _, cf in self.si_cf.values()),
+            ),
+        )
+        uniformity = np.column_stack(aggregate.get_si_cf_uniformity())
+        ranges = np.column_stack(aggregate.get_si_cf_ranges(max_si_cf))
+        for i, db in enumerate(self.dbs):
+            dm = DatabaseMetrics("", None, max_si_cf, db, self.si_cf[db])
+            np.testing.assert_allclose(uniformity[i], dm.get_si_cf_uniformity())
+            np.testing.assert_allclose(ranges[i], dm.get_si_cf_ranges())
+
+    def test_should_give_same_metrics_from_summaries(self):
+        aggregate = DatabaseAggregate.from_si_cf(self.dbs, self.si_cf)
+        summaries = {db: DatabaseSummary(*self.si_cf[db]) for db in self.dbs}
+        summarized = DatabaseAggregate.from_summaries(self.dbs, summaries)
+        max_si_cf = aggregate.get_max_si_cf()
+        self.assertEqual(summarized.get_max_si_cf(), max_si_cf)
+        np.testing.assert_allclose(
+            summarized.get_si_cf_uniformity(), aggregate.get_si_cf_uniformity()
+        )
+        np.testing.assert_allclose(
+            summarized.get_si_cf_ranges(max_si_cf),
+            aggregate.get_si_cf_ranges(max_si_cf),
+        )
+
+    def test_should_group_unsorted_db_ids(self):
+        db_ids = np.array([1, 0, 1, 0])
+        aggregate = DatabaseAggregate(
+            ["a", "b"], db_ids, np.array([1.0, 2.0, 3.0, 4.0]), np.ones(4)
+        )
+        self.assertListEqual(aggregate.images.tolist(), [2, 2])
+        self.assertListEqual(aggregate.minimum[0].tolist(), [2.0, 1.0])
+        self.assertListEqual(aggregate.maximum[0].tolist(), [4.0, 3.0])
+
+    def test_should_raise_exception_on_db_without_images(self):
+        with self.assertRaises(DatabaseAggregateError):
+            DatabaseAggregate(["a", "b"], np.zeros(2, int), np.ones(2), np.ones(2))
+
+    def test_should_raise_exception_on_arrays_of_different_length(self):
+        with self.assertRaises(DatabaseAggregateError):
+            DatabaseAggregate(["a"], np.zeros(2, int), np.ones(3), np.ones(2))
@@ -1,6 +1,16 @@
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
-from app.database_analyze import DatabaseAnalyze
+import numpy as np
+import pandas as pd
+
+from app.database_analyze import DatabaseAnalyze, DatabaseAnalyzeError, SingleMetrics
+from app.instrumentation import recorder
+from app.metrics_store import MetricsStore
 
 
 class TestImageCollection(TestCase):
@@ -9,3 +19,133 @@ class TestImageCollection(TestCase):
         da.analyze()
         self.assertGreater(da.df_single.size, 0)
         self.assertGreater(da.df_double.size, 0)
+
+    def test_should_fill_grid_density_metrics(self):
+        da = DatabaseAnalyze("tests/assets/")
+        da.analyze()
+        for metric in (
+            SingleMetrics.GRID_OCCUPANCY,
+            SingleMetrics.JOINT_UNIFORMITY,
+            SingleMetrics.KDE_COVERAGE,
+        ):
+            values = da.df_single[metric.value].astype(float)
+            self.assertTrue(((values > 0) & (values <= 1)).all())
+
+    def test_should_not_repeat_plots_when_analyzed_again(self):
+        with TemporaryDirectory() as output, patch(
+            "app.plot_render.render", return_value=True
+        ) as render:
+            da = DatabaseAnalyze("tests/assets/", output + "/")
+            da.analyze()
+            jobs = len(da.plot_jobs)
+            da.analyze()
+        self.assertEqual(len(da.plot_jobs), jobs)
+        self.assertEqual(render.call_count, 2 * jobs)
+
+    def test_should_not_import_plotting_libraries_on_init(self):
+        code = (
+            "import sys; from app.database_analyze import DatabaseAnalyze; "
+            "DatabaseAnalyze('tests/assets/', plots=False); "
+            "print(*(m for m in ('matplotlib', 'seaborn') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_should_give_same_results_with_multiple_workers(self):
+        serial = DatabaseAnalyze("tests/assets/")
+        parallel = DatabaseAnalyze("tests/assets/", workers=2)
+        self.assertDictEqual(serial.raw_si_cf, parallel.raw_si_cf)
+
+    def test_should_give_same_results_with_cache(self):
+        with TemporaryDirectory() as cache_dir:
+            first = DatabaseAnalyze("tests/assets/", cache=True, cache_dir=cache_dir)
+            cached = DatabaseAnalyze("tests/assets/", cache=True, cache_dir=cache_dir)
+        self.assertDictEqual(first.raw_si_cf, cached.raw_si_cf)
+
+    def test_should_raise_exception_on_unusable_cache_dir(self):
+        with self.assertRaises(DatabaseAnalyzeError):
+            DatabaseAnalyze("tests/assets/", cache=True, cache_dir=__file__)
+
+    def test_should_report_error_of_reduced_decode(self):
+        with patch("app.image_metrics.MIN_DECODE_ROWS", 128):
+            da = DatabaseAnalyze("tests/assets/", decode_scale=2)
+        report = da.decode_error()
+        self.assertListEqual(list(report.index), ["test_db", "test_db2"])
+        self.assertTrue((report > 0).all().all())
+        self.assertTrue((report["CF relative error"] < 0.1).all())
+
+    def test_should_raise_exception_on_decode_error_without_reduction(self):
+        with self.assertRaises(DatabaseAnalyzeError):
+            DatabaseAnalyze("tests/assets/").decode_error()
+
+    def test_should_rebuild_analysis_from_store(self):
+        with TemporaryDirectory() as store:
+            da = DatabaseAnalyze("tests/assets/", store=store)
+            da.analyze()
+            images = MetricsStore(store).read_table("images")
+            self.assertEqual(len(images["si"]), 6)
+            self.assertTrue((np.asarray(images["rows"]) == 512).all())
+            self.assertFalse(np.isnan(images["seconds"]).any())
+            self.assertGreater(np.max(images["seconds"]), 0.0)
+            with patch("app.image_metrics.ImageMetrics.calculate_si_cf") as calculate:
+                rebuilt = DatabaseAnalyze("tests/assets/", store=store, from_store=True)
+                rebuilt.analyze()
+            calculate.assert_not_called()
+            databases = MetricsStore(store).read_table("databases")
+            self.assertTrue(
+                os.path.isfile(os.path.join(store, "databases", "fill_rate.npy"))
+            )
+        self.assertDictEqual(rebuilt.raw_si_cf, da.raw_si_cf)
+        self.assertDictEqual(rebuilt.images, da.images)
+        # Area of rebuilt analysis comes from stored hull vertices, so it may differ in rounding
+        pd.testing.assert_frame_equal(
+            rebuilt.df_single.drop(columns="Palette"),
+            da.df_single.drop(columns="Palette"),
+            check_exact=False,
+        )
+        self.assertListEqual(databases["db"].tolist(), ["test_db", "test_db2"])
+
+    def test_should_store_cached_images_when_analyzed_again(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as store:
+            first = DatabaseAnalyze(
+                "tests/assets/", cache=True, cache_dir=cache_dir, store=store
+            )
+            first.analyze()
+            cached = DatabaseAnalyze(
+                "tests/assets/", cache=True, cache_dir=cache_dir, store=store
+            )
+            cached.analyze()
+            images = MetricsStore(store).read_table("images")
+            self.assertEqual(len(images["si"]), 6)
+            self.assertTrue((np.asarray(images["rows"]) == 512).all())
+        self.assertDictEqual(first.raw_si_cf, cached.raw_si_cf)
+
+    def test_should_raise_exception_on_summary_only_without_summaries(self):
+        with TemporaryDirectory() as store:
+            with self.assertRaises(DatabaseAnalyzeError):
+                DatabaseAnalyze("tests/assets/", store=store, summary_only=True)
+
+    def test_should_record_stages_when_instrumented(self):
+        with TemporaryDirectory() as output, patch(
+            "app.instrumentation.recorder.enabled", True
+        ), patch("app.plot_render.render", return_value=True):
+            try:
+                DatabaseAnalyze("tests/assets/", output + "/").analyze()
+                rows = recorder.rows()
+            finally:
+                recorder.reset()
+        stages = {row["stage"] for row in rows}
+        self.assertSetEqual(
+            stages, {"scan", "decode", "si_cf", "hull", "fill_rate", "plot", "bar"}
+        )
+        scan = [row for row in rows if row["stage"] == "scan"]
+        self.assertEqual(sum(row["items"] for row in scan), 6)
+
+    def test_should_report_near_duplicates_across_dbs(self):
+        duplicates = DatabaseAnalyze("tests/assets/").near_duplicates()
+        self.assertEqual(len(duplicates), 3)
+        self.assertTrue((duplicates["DB"] == "test_db").all())
+        self.assertTrue((duplicates["Image"] == duplicates["Other image"]).all())
+        self.assertTrue((duplicates["Distance"] == 0).all())
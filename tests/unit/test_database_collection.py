@@ -16,3 +16,8 @@ class TestDatabaseCollection(TestCase):
     def test_should_raise_exception_on_wrong_dir(self):
         with self.assertRaises(DatabaseIteratorInputError):
             DatabaseCollection("missing")
+
+    def test_should_list_sorted_databases(self):
+        self.assertEqual(
+            DatabaseCollection("tests/assets/").directories, ["test_db", "test_db2"]
+        )
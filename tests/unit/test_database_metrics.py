@@ -1,6 +1,13 @@
+import os
+from functools import partial
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
 from app.database_metrics import DatabaseMetrics, DatabaseMetricsError
+from app.fill_rate import FillRateBackend
+from app.plot_render import render
+from scipy.stats import entropy
 
 
 class TestDatabaseMetrics(TestCase):
@@ -10,7 +17,21 @@ class TestDatabaseMetrics(TestCase):
         )
 
     def test_should_plot_all(self):
-        self.dm.plot_all()
+        with TemporaryDirectory() as output, patch(
+            "app.plot_render.render", side_effect=partial(render, usetex=False)
+        ):
+            dm = DatabaseMetrics(
+                "tests/assets/test_db", output + "/", (112.02, 85.83), "test db"
+            )
+            dm.plot_all()
+            files = sorted(os.listdir(output))
+        self.assertListEqual(
+            files,
+            [
+                f"test db_{kind}.png"
+                for kind in ("convex_hull", "delaunay", "fixed_radius", "si_cf_plane")
+            ],
+        )
 
     def test_should_calculate_si_and_cf_ranges(self):
         si, cf = self.dm.get_si_cf_ranges()
@@ -36,3 +57,81 @@ class TestDatabaseMetrics(TestCase):
     def test_should_raise_on_missing_dir(self):
         with self.assertRaises(DatabaseMetricsError):
             DatabaseMetrics("missing", None, (100, 100), "test_db")
+
+    def test_should_create_metrics_from_raw_si_cf(self):
+        dm = DatabaseMetrics(
+            "missing", None, (112.02, 85.83), "test db", (self.dm.si, self.dm.cf)
+        )
+        self.assertListEqual(dm.norm_si, self.dm.norm_si)
+        self.assertAlmostEqual(dm.get_coverage_area(), self.dm.get_coverage_area())
+
+    def test_should_normalize_against_new_maxima(self):
+        self.dm.normalize((1.0, 1.0))
+        self.assertListEqual(self.dm.norm_si, self.dm.si)
+        self.assertListEqual(self.dm.norm_cf, self.dm.cf)
+
+    def test_should_calculate_similar_fill_rate_with_geometric_backend(self):
+        raster = self.dm.calculate_fill_rate_fixed_radius_area()
+        geometric = self.dm.calculate_fill_rate_fixed_radius_area(
+            backend=FillRateBackend.GEOMETRIC
+        )
+        self.assertAlmostEqual(raster, geometric, 2)
+
+    def test_should_calculate_spatial_index_coverage(self):
+        self.assertGreaterEqual(self.dm.get_nn_coverage(), 0.0)
+        self.assertLessEqual(self.dm.get_nn_coverage(), 1.0)
+        self.assertGreater(self.dm.get_union_area(), 0.0)
+        self.assertGreaterEqual(self.dm.get_point_density(), 0.0)
+
+    def test_should_calculate_grid_density_metrics(self):
+        self.assertGreater(self.dm.get_grid_occupancy(), 0.0)
+        self.assertLessEqual(self.dm.get_grid_occupancy(), 1.0)
+        self.assertGreaterEqual(self.dm.get_joint_uniformity(), 0.0)
+        self.assertLessEqual(self.dm.get_joint_uniformity(), 1.0)
+        self.assertGreater(self.dm.get_kde_coverage(), 0.0)
+        self.assertLessEqual(self.dm.get_kde_coverage(), 1.0)
+
+    def test_should_calculate_uniformity_as_entropy(self):
+        si_uni, cf_uni = self.dm.get_si_cf_uniformity()
+        self.assertAlmostEqual(si_uni, entropy(self.dm.si, base=10))
+        self.assertAlmostEqual(cf_uni, entropy(self.dm.cf, base=10))
+
+    def test_should_add_and_remove_images_incrementally(self):
+        dm = DatabaseMetrics("tests/assets/test_db", None, (112.02, 85.83), "test db")
+        dm.add_images(["tests/assets/test_db2/fruits.png", "tests/assets/fruits.png"])
+        self.assertEqual(len(dm.si), 5)
+        self.assertGreaterEqual(dm.hull.volume, self.dm.hull.volume)
+        self.assertEqual(len(dm.grid.points), 5)
+        dm.remove_images(["tests/assets/test_db2/fruits.png"])
+        expected = DatabaseMetrics(
+            "tests/assets/test_db",
+            None,
+            (112.02, 85.83),
+            "test db",
+            (dm.si, dm.cf),
+        )
+        self.assertEqual(len(dm.si), 4)
+        self.assertAlmostEqual(dm.get_coverage_area(), expected.get_coverage_area())
+        self.assertAlmostEqual(dm.hull.volume, expected.hull.volume)
+        self.assertAlmostEqual(dm.get_nn_coverage(), expected.get_nn_coverage())
+        self.assertAlmostEqual(dm.get_grid_occupancy(), expected.get_grid_occupancy())
+        for actual, reference in zip(
+            dm.get_si_cf_uniformity(), expected.get_si_cf_uniformity()
+        ):
+            self.assertAlmostEqual(actual, reference)
+
+    def test_should_raise_on_added_images_not_matching_si_cf(self):
+        with self.assertRaises(DatabaseMetricsError):
+            self.dm.add_images(["tests/assets/fruits.png"], ([1.0, 2.0], [1.0, 2.0]))
+        self.assertEqual(len(self.dm.si), 3)
+
+    def test_should_raise_on_removing_images_without_path(self):
+        dm = DatabaseMetrics(
+            "tests/assets/test_db",
+            None,
+            (112.02, 85.83),
+            si_cf=(self.dm.si, self.dm.cf),
+        )
+        with self.assertRaises(DatabaseMetricsError):
+            dm.remove_images([""])
+        self.assertEqual(len(dm.si), 3)
@@ -0,0 +1,84 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+from app.database_analyze import DatabaseAnalyze, SingleMetrics
+from app.database_shard import (
+    DatabaseShardError,
+    analyze_shard,
+    merge_shards,
+    merge_summaries,
+    select_shard,
+    summarize,
+)
+from app.database_summary import DatabaseSummary
+
+
+class TestDatabaseShard(TestCase):
+    def test_should_split_images_into_disjoint_shards(self):
+        shards = [select_shard("tests/assets/", i, 4) for i in range(4)]
+        positions = np.concatenate([p for p, _ in shards])
+        images = [image for _, shard in shards for image in shard]
+        self.assertListEqual(sorted(positions.tolist()), list(range(6)))
+        self.assertEqual(len(set(images)), 6)
+        self.assertListEqual(shards[0][1], select_shard("tests/assets/", 0, 4)[1])
+
+    def test_should_merge_shards_to_same_results_as_single_run(self):
+        with TemporaryDirectory() as store:
+            for i in range(4):
+                analyze_shard("tests/assets/", store, i, 4)
+            summary = merge_shards(store, 4)
+            merged = DatabaseAnalyze("tests/assets/", store=store, from_store=True)
+        single = DatabaseAnalyze("tests/assets/")
+        self.assertDictEqual(merged.raw_si_cf, single.raw_si_cf)
+        self.assertDictEqual(merged.images, single.images)
+        self.assertListEqual([s.images for s in summary.values()], [3, 3])
+        for db, s in summary.items():
+            self.assertEqual(
+                s.get_coverage_area((single.max_si, single.max_cf)),
+                DatabaseSummary(*single.raw_si_cf[db]).get_coverage_area(
+                    (single.max_si, single.max_cf)
+                ),
+            )
+        self.assertEqual(max(s.si_max for s in summary.values()), single.max_si)
+        self.assertEqual(max(s.cf_max for s in summary.values()), single.max_cf)
+
+    def test_should_analyze_merged_summaries_without_points(self):
+        with TemporaryDirectory() as store:
+            for i in range(2):
+                analyze_shard("tests/assets/", store, i, 2)
+            merge_shards(store, 2)
+            merged = DatabaseAnalyze("tests/assets/", store=store, summary_only=True)
+            merged.analyze()
+        single = DatabaseAnalyze("tests/assets/")
+        single.analyze()
+        self.assertDictEqual(merged.raw_si_cf, {})
+        self.assertEqual((merged.max_si, merged.max_cf), (single.max_si, single.max_cf))
+        area = SingleMetrics.AREA.value
+        np.testing.assert_allclose(
+            merged.df_single[area].astype(float), single.df_single[area].astype(float)
+        )
+        np.testing.assert_allclose(
+            merged.df_double.astype(float), single.df_double.astype(float)
+        )
+        self.assertTrue(merged.df_single[SingleMetrics.FILL_RATE.value].isna().all())
+
+    def test_should_merge_summaries(self):
+        first = summarize(np.array(["a", "b"]), np.array([1.0, 2.0]), np.ones(2))
+        second = summarize(np.array(["a", "a"]), np.array([3.0, 0.5]), np.ones(2))
+        summary = merge_summaries([first, second])
+        self.assertListEqual(list(summary), ["a", "b"])
+        self.assertListEqual([s.images for s in summary.values()], [3, 1])
+        self.assertEqual(summary["a"].si_min, 0.5)
+        self.assertEqual(summary["a"].si_max, 3.0)
+        self.assertEqual(summary["b"].get_max_si_cf(), (2.0, 1.0))
+
+    def test_should_raise_exception_on_missing_shard(self):
+        with TemporaryDirectory() as store:
+            analyze_shard("tests/assets/", store, 0, 2)
+            with self.assertRaises(DatabaseShardError):
+                merge_shards(store, 2)
+
+    def test_should_raise_exception_on_wrong_shard(self):
+        with self.assertRaises(DatabaseShardError):
+            select_shard("tests/assets/", 2, 2)
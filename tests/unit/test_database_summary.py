@@ -0,0 +1,72 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from app.database_metrics import DatabaseMetrics
+from app.database_summary import (
+    DatabaseSummary,
+    DatabaseSummaryError,
+    summaries_from_tables,
+    summaries_to_tables,
+)
+
+MAX_SI_CF = (120.0, 90.0)
+
+
+class TestDatabaseSummary(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.si = rng.uniform(1, 100, 1000)
+        self.cf = rng.uniform(1, 80, 1000)
+
+    def test_should_give_same_metrics_as_database_metrics(self):
+        summary = DatabaseSummary(self.si, self.cf)
+        dm = DatabaseMetrics("", None, MAX_SI_CF, "db", (self.si, self.cf))
+        self.assertLess(len(summary.hull_points), 50)
+        self.assertAlmostEqual(
+            summary.get_coverage_area(MAX_SI_CF), dm.get_coverage_area()
+        )
+        np.testing.assert_allclose(
+            summary.get_si_cf_ranges(MAX_SI_CF), dm.get_si_cf_ranges()
+        )
+        np.testing.assert_allclose(
+            summary.get_si_cf_uniformity(), dm.get_si_cf_uniformity()
+        )
+        self.assertEqual(summary.get_max_si_cf(), dm.get_max_si_cf())
+
+    def test_should_give_same_summary_in_chunks_and_merged(self):
+        whole = DatabaseSummary(self.si, self.cf)
+        with patch("app.database_summary.SUMMARY_CHUNK", 64):
+            chunked = DatabaseSummary(self.si, self.cf)
+        merged = DatabaseSummary(self.si[:300], self.cf[:300])
+        merged.merge(DatabaseSummary(self.si[300:], self.cf[300:]))
+        for summary in (chunked, merged):
+            self.assertEqual(summary.images, 1000)
+            self.assertAlmostEqual(
+                summary.get_coverage_area(MAX_SI_CF), whole.get_coverage_area(MAX_SI_CF)
+            )
+            np.testing.assert_allclose(summary.entropy_sums, whole.entropy_sums)
+
+    def test_should_return_zero_area_for_degenerate_db(self):
+        summary = DatabaseSummary([1.0, 2.0, 3.0], [1.0, 2.0, 3.0])
+        self.assertEqual(len(summary.hull_points), 2)
+        self.assertEqual(summary.get_coverage_area(MAX_SI_CF), 0.0)
+
+    def test_should_restore_summaries_from_tables(self):
+        summaries = {
+            "a": DatabaseSummary(self.si, self.cf),
+            "b": DatabaseSummary(self.cf, self.si),
+        }
+        restored = summaries_from_tables(*summaries_to_tables(summaries))
+        for db, summary in summaries.items():
+            self.assertEqual(restored[db].images, summary.images)
+            np.testing.assert_array_equal(restored[db].hull_points, summary.hull_points)
+            np.testing.assert_array_equal(
+                restored[db].entropy_sums, summary.entropy_sums
+            )
+
+    def test_should_raise_exception_on_missing_column(self):
+        summary, hull = summaries_to_tables({"a": DatabaseSummary(self.si, self.cf)})
+        del summary["si_max"]
+        with self.assertRaises(DatabaseSummaryError):
+            summaries_from_tables(summary, hull)
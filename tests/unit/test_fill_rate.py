@@ -0,0 +1,19 @@
+from unittest import TestCase
+
+import numpy as np
+from app.fill_rate import fill_rate_geometric
+
+SQUARE = np.array([[0.0, 0.0], [0.0, 10.0], [10.0, 0.0], [10.0, 10.0]])
+
+
+class TestFillRate(TestCase):
+    def test_should_be_full_for_large_radius(self):
+        self.assertEqual(fill_rate_geometric(SQUARE, 2000), 1.0)
+
+    def test_should_be_empty_for_zero_radius(self):
+        self.assertLess(fill_rate_geometric(SQUARE, 0), 0.01)
+
+    def test_should_not_depend_on_data_scale(self):
+        self.assertAlmostEqual(
+            fill_rate_geometric(SQUARE, 60), fill_rate_geometric(SQUARE * 7, 60)
+        )
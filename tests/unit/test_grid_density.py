@@ -0,0 +1,48 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from app.grid_density import GridDensity, GridDensityError
+
+
+class TestGridDensity(TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        self.uniform = GridDensity(rng.uniform(0, 1, (20000, 2)))
+        self.cluster = GridDensity(np.full((100, 2), 0.3))
+
+    def test_should_count_points_in_unit_square(self):
+        counts = GridDensity(np.array([[0.0, 0.0], [1.0, 1.0], [0.6, 0.1]])).histogram(
+            2
+        )
+        np.testing.assert_array_equal(counts, [[1, 0], [1, 1]])
+
+    def test_should_bin_points_once_per_resolution(self):
+        grid = GridDensity(np.array([[0.1, 0.2], [0.7, 0.9]]))
+        with patch("numpy.histogram2d", wraps=np.histogram2d) as histogram2d:
+            grid.occupancy(8)
+            grid.joint_uniformity(8)
+            grid.kde_coverage(0.05, 0.1, 32)
+            grid.kde_coverage(0.1, 0.2, 32)
+        self.assertEqual(histogram2d.call_count, 2)
+
+    def test_should_raise_on_single_cell_grid(self):
+        for resolution in (1, 0):
+            with self.assertRaises(GridDensityError):
+                self.uniform.joint_uniformity(resolution)
+        with self.assertRaises(GridDensityError):
+            self.uniform.kde_coverage(resolution=1)
+
+    def test_should_calculate_grid_occupancy(self):
+        self.assertEqual(self.uniform.occupancy(16), 1.0)
+        self.assertEqual(self.cluster.occupancy(16), 1 / 16 ** 2)
+
+    def test_should_calculate_joint_uniformity(self):
+        self.assertAlmostEqual(self.uniform.joint_uniformity(8), 1.0, 2)
+        self.assertEqual(self.cluster.joint_uniformity(8), 0.0)
+
+    def test_should_calculate_kde_coverage(self):
+        self.assertGreater(self.uniform.kde_coverage(0.05, 0.1), 0.95)
+        coverage = self.cluster.kde_coverage(0.05, 0.1)
+        self.assertGreater(coverage, 0.0)
+        self.assertLess(coverage, 0.25)
@@ -0,0 +1,57 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+from app.image_batch_metrics import ImageBatchMetrics, calculate_si_cf_files
+from app.image_metrics import ImageMetrics, ImageMetricsInputError
+
+IMAGES = [
+    "tests/assets/test_db/fruits.png",
+    "tests/assets/test_db/lena.png",
+    "tests/assets/test_db/baboon.png",
+]
+
+
+class TestImageBatchMetrics(TestCase):
+    def test_should_match_single_image_metrics(self):
+        stack = np.stack([cv2.imread(image) for image in IMAGES])
+        si, cf = ImageBatchMetrics(stack).calculate_si_cf()
+        expected = np.array([ImageMetrics(image).calculate_si_cf() for image in IMAGES])
+        np.testing.assert_allclose(si, expected[:, 0], rtol=1e-12)
+        np.testing.assert_allclose(cf, expected[:, 1], rtol=1e-12)
+
+    def test_should_give_same_results_for_chunks(self):
+        stack = np.stack([cv2.imread(image) for image in IMAGES])
+        si, cf = ImageBatchMetrics(stack).calculate_si_cf()
+        with patch("app.image_batch_metrics.BATCH_PIXELS", 1):
+            chunked_si, chunked_cf = ImageBatchMetrics(stack).calculate_si_cf()
+        np.testing.assert_allclose(chunked_si, si, rtol=1e-12)
+        np.testing.assert_allclose(chunked_cf, cf, rtol=1e-12)
+
+    def test_should_raise_exception_on_wrong_array(self):
+        with self.assertRaises(ImageMetricsInputError):
+            ImageBatchMetrics(np.zeros((2, 8, 8), np.uint8))
+        with self.assertRaises(ImageMetricsInputError):
+            ImageBatchMetrics(np.zeros((2, 8, 8, 3)))
+
+    def test_should_group_files_by_shape_and_keep_order(self):
+        with TemporaryDirectory() as tmp:
+            images = list()
+            for i, image in enumerate(IMAGES * 2):
+                img = cv2.imread(image)
+                filename = os.path.join(tmp, f"{i}.png")
+                cv2.imwrite(filename, img if i % 2 else img[:200, :300])
+                images.append(filename)
+            si, cf = calculate_si_cf_files(images, batch_size=3)
+            expected = np.array(
+                [ImageMetrics(image).calculate_si_cf() for image in images]
+            )
+        np.testing.assert_allclose(si, expected[:, 0], rtol=1e-12)
+        np.testing.assert_allclose(cf, expected[:, 1], rtol=1e-12)
+
+    def test_should_raise_exception_on_missing_file(self):
+        with self.assertRaises(ImageMetricsInputError):
+            calculate_si_cf_files(IMAGES + ["missing.png"])
@@ -1,5 +1,10 @@
+import os
+import shutil
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
+import numpy as np
 from app.image_collection import ImageCollection, ImageIteratorInputError
 
 
@@ -17,3 +22,40 @@ class TestImageCollection(TestCase):
     def test_should_raise_exception_on_wrong_dir(self):
         with self.assertRaises(ImageIteratorInputError):
             ImageCollection("missing")
+
+    def test_should_raise_exception_on_empty_dir(self):
+        with TemporaryDirectory() as tmp:
+            with self.assertRaises(ImageIteratorInputError):
+                ImageCollection(tmp)
+
+    def test_should_scan_directory_once(self):
+        with patch("app.image_collection.os.scandir", wraps=os.scandir) as scandir:
+            ic = ImageCollection("tests/assets/test_db")
+            first = list(ic)
+            self.assertListEqual(list(ic), first)
+            self.assertEqual(ic.files, ["baboon.png", "fruits.png", "lena.png"])
+        self.assertEqual(scandir.call_count, 1)
+
+    def test_should_yield_sorted_images(self):
+        ic = ImageCollection("tests/assets/test_db")
+        self.assertEqual(ic.files, ["baboon.png", "fruits.png", "lena.png"])
+
+    def test_should_scan_recursively_with_any_extension_case(self):
+        with TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "b", "c"))
+            for name in ("a.PNG", "b/b.Jpg", "b/c/c.png", "b/notes.txt"):
+                shutil.copy("tests/assets/fruits.png", os.path.join(tmp, name))
+            self.assertEqual(ImageCollection(tmp).files, ["a.PNG"])
+            self.assertEqual(
+                ImageCollection(tmp, recursive=True).files,
+                ["a.PNG", "b/b.Jpg", "b/c/c.png"],
+            )
+
+    def test_should_yield_frames_of_raw_stacks(self):
+        with TemporaryDirectory() as tmp:
+            np.save(os.path.join(tmp, "frames.npy"), np.zeros((3, 4, 4, 3), np.uint8))
+            np.save(os.path.join(tmp, "single.npy"), np.zeros((4, 4, 3), np.uint8))
+            self.assertListEqual(
+                ImageCollection(tmp).files,
+                ["frames.npy#0", "frames.npy#1", "frames.npy#2", "single.npy"],
+            )
@@ -0,0 +1,69 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+from app.image_dedup import (
+    ImageDedupError,
+    hamming_distance,
+    near_duplicates,
+    perceptual_hash,
+    perceptual_hashes,
+    unique_files,
+)
+
+
+class TestImageDedup(TestCase):
+    def test_should_find_byte_identical_files(self):
+        images = [
+            "tests/assets/test_db/fruits.png",
+            "tests/assets/test_db/lena.png",
+            "tests/assets/test_db2/fruits.png",
+            "missing.png",
+            "tests/assets/fruits.png",
+        ]
+        unique, inverse = unique_files(images)
+        self.assertListEqual(unique, [0, 1, 3])
+        self.assertListEqual(inverse, [0, 1, 0, 2, 0])
+
+    def test_should_give_close_hash_of_recompressed_image(self):
+        img = cv2.imread("tests/assets/test_db/lena.png")
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "lena.jpg")
+            cv2.imwrite(filename, cv2.resize(img, (300, 300)))
+            distance = hamming_distance(
+                np.uint64(perceptual_hash("tests/assets/test_db/lena.png")),
+                np.uint64(perceptual_hash(filename)),
+            )
+        self.assertLessEqual(distance, 6)
+
+    def test_should_compute_hamming_distance(self):
+        a = np.array([0, 0xFF, 2**64 - 1], dtype=np.uint64)
+        self.assertListEqual(hamming_distance(a, np.uint64(0)).tolist(), [0, 8, 64])
+
+    def test_should_find_near_duplicates_only_across_groups(self):
+        hashes = np.array([0b1, 0b11, 0b0, 0xFFFF], dtype=np.uint64)
+        pairs = near_duplicates(hashes, np.array(["a", "a", "b", "b"]), 1)
+        self.assertListEqual(pairs, [(0, 2, 1)])
+
+    def test_should_find_same_near_duplicates_in_blocks(self):
+        rng = np.random.default_rng(0)
+        hashes = rng.integers(0, 4, 11).astype(np.uint64)
+        groups = rng.integers(0, 3, 11)
+        whole = near_duplicates(hashes, groups, 1)
+        with patch("app.image_dedup.HASH_CHUNK", 3):
+            self.assertListEqual(sorted(near_duplicates(hashes, groups, 1)), whole)
+        self.assertGreater(len(whole), 0)
+
+    def test_should_hash_images_in_parallel(self):
+        images = ["tests/assets/test_db/lena.png", "tests/assets/test_db/baboon.png"]
+        self.assertListEqual(
+            perceptual_hashes(images, 2).tolist(),
+            [perceptual_hash(image) for image in images],
+        )
+
+    def test_should_raise_exception_on_unreadable_image(self):
+        with self.assertRaises(ImageDedupError):
+            perceptual_hash("missing.png")
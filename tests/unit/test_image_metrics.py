@@ -1,6 +1,12 @@
+import os
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
-from app.image_metrics import ImageMetrics, ImageMetricsInputError
+import cv2
+import numpy as np
+from app.image_metrics import ImageMetrics, ImageMetricsInputError, read_image_size
+from app.si_cf_kernel import SiCfBackend
 
 
 class TestImageMetrics(TestCase):
@@ -15,3 +21,96 @@ class TestImageMetrics(TestCase):
     def test_should_raise_exception_on_missing_image(self):
         with self.assertRaises(ImageMetricsInputError):
             ImageMetrics("missing")
+
+    def test_should_match_per_channel_float64_spatial_information(self):
+        img = cv2.imread("tests/assets/fruits.png")
+        si_rgb = [0.0] * 3
+        for d in range(3):
+            sobelx = cv2.Sobel(img[:, :, d], cv2.CV_64F, 1, 0, ksize=3)
+            sobely = cv2.Sobel(img[:, :, d], cv2.CV_64F, 0, 1, ksize=3)
+            si_rgb[d] = np.sqrt(img.shape[0] / 1080.0) * np.sqrt(
+                np.sum(sobelx ** 2 + sobely ** 2) / (img.shape[0] * img.shape[1])
+            )
+        expected_si = 0.299 * si_rgb[2] + 0.587 * si_rgb[1] + 0.114 * si_rgb[0]
+        si, _ = ImageMetrics("tests/assets/fruits.png").calculate_si_cf()
+        self.assertLess(abs(si - expected_si) / expected_si, 1e-9)
+
+    def test_should_match_float64_colorfulness(self):
+        img = cv2.imread("tests/assets/fruits.png").astype("float")
+        rg = img[:, :, 2] - img[:, :, 1]
+        yb = 0.5 * (img[:, :, 2] + img[:, :, 1]) - img[:, :, 0]
+        expected_cf = np.sqrt(np.std(rg) ** 2 + np.std(yb) ** 2) + 0.3 * np.sqrt(
+            np.mean(rg) ** 2 + np.mean(yb) ** 2
+        )
+        _, cf = ImageMetrics("tests/assets/fruits.png").calculate_si_cf()
+        self.assertLess(abs(cf - expected_cf) / expected_cf, 1e-9)
+
+    def test_should_give_same_results_for_strips(self):
+        si, cf = ImageMetrics("tests/assets/fruits.png").calculate_si_cf()
+        for tile_rows in (1, 2, 7, 100, 1000):
+            tiled_si, tiled_cf = ImageMetrics(
+                "tests/assets/fruits.png", tile_rows
+            ).calculate_si_cf()
+            self.assertAlmostEqual(tiled_si, si, 9)
+            self.assertAlmostEqual(tiled_cf, cf, 9)
+
+    def test_should_give_same_results_with_fused_backend(self):
+        img = cv2.resize(cv2.imread("tests/assets/fruits.png"), (24, 16))
+        expected = ImageMetrics(img).calculate_si_cf()
+        with patch("app.image_metrics.resolve_backend", lambda backend: backend):
+            im = ImageMetrics(img, tile_rows=5, backend=SiCfBackend.FUSED)
+        self.assertEqual(im.backend, SiCfBackend.FUSED)
+        np.testing.assert_allclose(im.calculate_si_cf(), expected)
+
+    def test_should_read_size_from_header(self):
+        self.assertEqual(read_image_size("tests/assets/fruits.png"), (512, 512))
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "fruits.jpg")
+            img = cv2.imread("tests/assets/fruits.png")
+            cv2.imwrite(filename, img[:300])
+            self.assertEqual(read_image_size(filename), (300, 512))
+            filename = os.path.join(tmp, "fruits.bmp")
+            cv2.imwrite(filename, img)
+            self.assertIsNone(read_image_size(filename))
+
+    def test_should_decode_small_image_at_full_resolution(self):
+        si, cf = ImageMetrics("tests/assets/fruits.png").calculate_si_cf()
+        im = ImageMetrics("tests/assets/fruits.png", decode_scale=8)
+        self.assertEqual(im.scale, 1)
+        self.assertEqual(im.calculate_si_cf(), (si, cf))
+
+    def test_should_decode_at_reduced_resolution(self):
+        with patch("app.image_metrics.MIN_DECODE_ROWS", 128):
+            im = ImageMetrics("tests/assets/fruits.png", decode_scale=8)
+        self.assertEqual(im.scale, 4)
+        self.assertEqual(im.img.shape, (128, 128, 3))
+
+    def test_should_raise_exception_on_wrong_decode_scale(self):
+        with self.assertRaises(ImageMetricsInputError):
+            ImageMetrics("tests/assets/fruits.png", decode_scale=3)
+
+    def test_should_give_same_results_for_image_in_memory(self):
+        with open("tests/assets/fruits.png", "rb") as f:
+            data = f.read()
+        self.assertEqual(
+            ImageMetrics("tests/assets/fruits.png", data=data).calculate_si_cf(),
+            ImageMetrics("tests/assets/fruits.png").calculate_si_cf(),
+        )
+
+    def test_should_give_same_results_for_raw_frames(self):
+        img = cv2.imread("tests/assets/fruits.png")
+        expected = ImageMetrics("tests/assets/fruits.png").calculate_si_cf()
+        with TemporaryDirectory() as tmp:
+            stack = os.path.join(tmp, "frames.npy")
+            np.save(stack, np.stack((img[::-1], img)))
+            frame = ImageMetrics(stack + "#1")
+            self.assertIsInstance(frame.img, np.memmap)
+            self.assertEqual(frame.calculate_si_cf(), expected)
+            self.assertEqual(read_image_size(stack + "#1"), img.shape[:2])
+            with self.assertRaises(ImageMetricsInputError):
+                ImageMetrics(stack + "#2")
+        self.assertEqual(ImageMetrics(img).calculate_si_cf(), expected)
+
+    def test_should_raise_exception_on_wrong_raw_array(self):
+        with self.assertRaises(ImageMetricsInputError):
+            ImageMetrics(np.zeros((4, 4), np.uint8))
@@ -0,0 +1,73 @@
+import math
+from unittest import TestCase
+from unittest.mock import patch
+
+from app.image_metrics import ImageMetrics, ImageMetricsInputError
+from app.image_metrics_pool import ImageMetricsPool, _calculate_record
+
+IMAGES = [
+    "tests/assets/test_db/fruits.png",
+    "tests/assets/test_db2/lena.png",
+    "tests/assets/fruits.png",
+]
+
+
+class TestImageMetricsPool(TestCase):
+    def test_should_keep_input_order(self):
+        expected = [ImageMetrics(image).calculate_si_cf() for image in IMAGES]
+        results = ImageMetricsPool(2).calculate_si_cf(IMAGES)
+        self.assertListEqual(results, expected)
+
+    def test_should_raise_image_metrics_error_from_worker(self):
+        with self.assertRaises(ImageMetricsInputError):
+            ImageMetricsPool(2).calculate_si_cf(IMAGES + ["missing.png"])
+
+    def test_should_raise_on_negative_workers(self):
+        with self.assertRaises(ImageMetricsInputError):
+            ImageMetricsPool(-1)
+
+    def test_should_keep_input_order_with_prefetching(self):
+        expected = [ImageMetrics(image).calculate_si_cf() for image in IMAGES * 4]
+        pool = ImageMetricsPool(2, prefetch=2, queue_size=1)
+        self.assertListEqual(pool.calculate_si_cf(IMAGES * 4), expected)
+
+    def test_should_raise_image_metrics_error_with_prefetching(self):
+        with self.assertRaises(ImageMetricsInputError):
+            ImageMetricsPool(2, prefetch=2).calculate_si_cf(IMAGES + ["missing.png"])
+
+    def test_should_raise_unexpected_error_with_prefetching(self):
+        with patch(
+            "app.image_metrics_pool._calculate_record",
+            side_effect=MemoryError("out of memory"),
+        ), self.assertRaises(MemoryError):
+            ImageMetricsPool(2, prefetch=2, queue_size=1).calculate_si_cf(IMAGES * 4)
+
+    def test_should_time_images_only_when_instrumented(self):
+        record = _calculate_record(IMAGES[0])
+        self.assertTrue(math.isnan(record.seconds))
+        with patch("app.image_metrics_pool.recorder.enabled", True):
+            records = ImageMetricsPool(1).calculate_records(IMAGES[:1])
+        self.assertGreater(records[0].seconds, 0.0)
+        self.assertGreaterEqual(records[0].seconds, records[0].decode_seconds)
+
+    def test_should_time_images_when_requested(self):
+        records = ImageMetricsPool(1, timed=True).calculate_records(IMAGES)
+        self.assertGreater(records[0].seconds, 0.0)
+        self.assertGreater(records[1].decode_cpu_seconds, 0.0)
+
+    def test_should_calculate_identical_files_once(self):
+        with patch(
+            "app.image_metrics_pool._calculate_record",
+            side_effect=lambda image, **kwargs: _calculate_record(image, **kwargs),
+        ) as calculate:
+            records = ImageMetricsPool(1, dedup=True).calculate_records(IMAGES * 2)
+        self.assertEqual(calculate.call_count, 2)
+        self.assertListEqual(
+            [(r.si, r.cf) for r in records],
+            [ImageMetrics(image).calculate_si_cf() for image in IMAGES * 2],
+        )
+        self.assertTrue(math.isnan(records[2].seconds))
+        timed = ImageMetricsPool(1, dedup=True, timed=True).calculate_records(
+            IMAGES * 2
+        )
+        self.assertEqual(timed[2].seconds, 0.0)
@@ -0,0 +1,72 @@
+import csv
+import json
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from app.instrumentation import (
+    REPORT_FIELDS,
+    InstrumentationError,
+    Progress,
+    StageRecorder,
+)
+
+
+class TestInstrumentation(TestCase):
+    def test_should_not_collect_anything_when_disabled(self):
+        recorder = StageRecorder(enabled=False)
+        with recorder.stage("scan", "db") as stage:
+            stage.items = 10
+        recorder.add("decode", "db", 1.0, 1.0)
+        self.assertListEqual(recorder.rows(), [])
+
+    def test_should_accumulate_stage_statistics(self):
+        recorder = StageRecorder(enabled=True)
+        with recorder.stage("scan", "db") as stage:
+            stage.items = 10
+        recorder.add("decode", "db", 1.0, 0.5)
+        recorder.add("decode", "db", 2.0, 1.5)
+        scan, decode = recorder.rows()
+        self.assertEqual((scan["stage"], scan["calls"], scan["items"]), ("scan", 1, 10))
+        self.assertEqual(decode["calls"], 2)
+        self.assertAlmostEqual(decode["wall_seconds"], 3.0)
+        self.assertAlmostEqual(decode["cpu_seconds"], 2.0)
+        self.assertGreater(decode["peak_rss_mb"], 0)
+        recorder.reset()
+        self.assertListEqual(recorder.rows(), [])
+
+    def test_should_write_csv_and_json_report(self):
+        recorder = StageRecorder(enabled=True)
+        recorder.add("hull", "db", 1.0, 1.0, 5)
+        with TemporaryDirectory() as tmp:
+            recorder.write_report(os.path.join(tmp, "report.csv"))
+            recorder.write_report(os.path.join(tmp, "report.json"))
+            with open(os.path.join(tmp, "report.csv")) as f:
+                reader = csv.DictReader(f)
+                rows = list(reader)
+            self.assertListEqual(reader.fieldnames, list(REPORT_FIELDS))
+            self.assertEqual(rows[0]["items"], "5")
+            with open(os.path.join(tmp, "report.json")) as f:
+                self.assertEqual(json.load(f)["stages"][0]["stage"], "hull")
+
+    def test_should_raise_exception_on_unwritable_report(self):
+        with self.assertRaises(InstrumentationError):
+            StageRecorder(enabled=True).write_report("missing/report.json")
+
+    def test_should_show_progress_line(self):
+        stream = StringIO()
+        progress = Progress(4, enabled=True, stream=stream, interval=0)
+        progress.update(2)
+        self.assertEqual(progress.line(1.0), "2/4 images, 2.0 images/s, ETA 1 s")
+        progress.update(2)
+        progress.close()
+        self.assertIn("4/4 images", stream.getvalue())
+        self.assertTrue(stream.getvalue().endswith("\n"))
+
+    def test_should_not_show_disabled_progress(self):
+        stream = StringIO()
+        progress = Progress(4, enabled=False, stream=stream)
+        progress.update()
+        progress.close()
+        self.assertEqual(stream.getvalue(), "")
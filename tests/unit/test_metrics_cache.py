@@ -0,0 +1,58 @@
+import os
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from app.metrics_cache import MetricsCache, MetricsCacheError
+
+
+class TestMetricsCache(TestCase):
+    def setUp(self) -> None:
+        self.tmp = TemporaryDirectory()
+        self.image = shutil.copy("tests/assets/fruits.png", self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_should_return_stored_values(self):
+        with MetricsCache(self.tmp.name) as cache:
+            self.assertListEqual(cache.get_many([self.image]), [None])
+            cache.put_many([self.image], [(1.0, 2.0)])
+        with MetricsCache(self.tmp.name) as cache:
+            self.assertListEqual(cache.get_many([self.image]), [(1.0, 2.0)])
+
+    def test_should_keep_reduced_decode_values_separately(self):
+        with MetricsCache(self.tmp.name) as cache:
+            cache.put_many([self.image], [(1.0, 2.0)])
+        with MetricsCache(self.tmp.name, decode_scale=2) as cache:
+            self.assertListEqual(cache.get_many([self.image]), [None])
+
+    def test_should_treat_modified_file_as_stale(self):
+        with MetricsCache(self.tmp.name) as cache:
+            cache.put_many([self.image], [(1.0, 2.0)])
+            os.utime(self.image, ns=(0, 0))
+            self.assertListEqual(cache.get_many([self.image]), [None])
+
+    def test_should_keep_touched_file_with_content_hash(self):
+        with MetricsCache(self.tmp.name, content_hash=True) as cache:
+            cache.put_many([self.image], [(1.0, 2.0)])
+            os.utime(self.image, ns=(0, 0))
+            self.assertListEqual(cache.get_many([self.image]), [(1.0, 2.0)])
+
+    def test_should_evict_removed_files(self):
+        with MetricsCache(self.tmp.name) as cache:
+            cache.put_many([self.image], [(1.0, 2.0)])
+            self.assertEqual(cache.prune([]), 1)
+            self.assertEqual(cache.prune([]), 0)
+
+    def test_should_create_missing_cache_dir(self):
+        cache_dir = os.path.join(self.tmp.name, "cache", "nested")
+        with MetricsCache(self.tmp.name, cache_dir) as cache:
+            cache.put_many([self.image], [(1.0, 2.0)])
+        with MetricsCache(self.tmp.name, cache_dir) as cache:
+            self.assertListEqual(cache.get_many([self.image]), [(1.0, 2.0)])
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_should_raise_exception_when_cache_dir_is_file(self):
+        with self.assertRaises(MetricsCacheError):
+            MetricsCache(self.tmp.name, self.image)
@@ -0,0 +1,56 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+from app.metrics_store import (
+    IMAGE_COLUMNS,
+    MetricsStore,
+    MetricsStoreError,
+    column_name,
+)
+
+
+class TestMetricsStore(TestCase):
+    def test_should_read_written_table(self):
+        with TemporaryDirectory() as tmp:
+            store = MetricsStore(tmp)
+            self.assertFalse(store.exists("images"))
+            store.write_table(
+                "images",
+                {"file": np.array(["a.png", "b.png"]), "si": np.array([1.0, 2.0])},
+            )
+            table = store.read_table("images")
+            self.assertTrue(store.exists("images"))
+            self.assertListEqual(table["file"].tolist(), ["a.png", "b.png"])
+            self.assertIsInstance(table["si"], np.memmap)
+            np.testing.assert_array_equal(table["si"], [1.0, 2.0])
+
+    def test_should_replace_existing_table(self):
+        with TemporaryDirectory() as tmp:
+            store = MetricsStore(tmp)
+            store.write_table("t", {"a": np.zeros(2), "b": np.zeros(2)})
+            store.write_table("t", {"a": np.ones(3)})
+            self.assertListEqual(list(store.read_table("t")), ["a"])
+
+    def test_should_raise_exception_on_columns_of_different_length(self):
+        with TemporaryDirectory() as tmp:
+            with self.assertRaises(MetricsStoreError):
+                MetricsStore(tmp).write_table("t", {"a": np.zeros(2), "b": np.zeros(3)})
+
+    def test_should_raise_exception_on_missing_table(self):
+        with self.assertRaises(MetricsStoreError):
+            MetricsStore("missing").read_table("images")
+
+    def test_should_raise_exception_on_missing_required_columns(self):
+        with TemporaryDirectory() as tmp:
+            store = MetricsStore(tmp)
+            store.write_table("images", {"db": np.array(["a"]), "si": np.zeros(1)})
+            with self.assertRaises(MetricsStoreError):
+                store.read_table("images", required=IMAGE_COLUMNS)
+            self.assertIn("si", store.read_table("images", required=("db", "si")))
+
+    def test_should_convert_metric_names(self):
+        self.assertEqual(
+            column_name("Nearest neighbour coverage"), "nearest_neighbour_coverage"
+        )
+        self.assertEqual(column_name("Uniformity SI"), "uniformity_si")
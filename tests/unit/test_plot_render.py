@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from app.plot_render import (
+    PlotJob,
+    PlotRenderError,
+    render,
+    render_all,
+    stored_digest,
+)
+
+POINTS = np.array([[0.0, 0.0], [0.0, 10.0], [10.0, 0.0], [10.0, 10.0]])
+
+
+class TestPlotRender(TestCase):
+    def test_should_skip_up_to_date_plot(self):
+        with TemporaryDirectory() as tmp:
+            job = PlotJob(
+                os.path.join(tmp, "plane.png"),
+                "si_cf_plane",
+                {"points": POINTS},
+                (4, 4),
+                {"title": "plane"},
+            )
+            self.assertTrue(render(job, usetex=False))
+            self.assertTrue(os.path.isfile(job.filename))
+            self.assertEqual(stored_digest(job.filename), job.digest(usetex=False))
+            self.assertFalse(render(job, usetex=False))
+
+    def test_should_rerender_changed_plot(self):
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "plane.png")
+            job = PlotJob(filename, "si_cf_plane", {"points": POINTS}, (4, 4), {})
+            render(job, usetex=False)
+            changed = PlotJob(
+                filename, "si_cf_plane", {"points": POINTS * 2}, (4, 4), {}
+            )
+            self.assertTrue(render(changed, usetex=False))
+
+    def test_should_not_time_plots_when_not_instrumented(self):
+        job = PlotJob("plane.png", "si_cf_plane", {"points": POINTS}, (4, 4), {})
+        with patch("app.plot_render.render", return_value=True) as rendered, patch(
+            "app.plot_render._render_timed"
+        ) as timed:
+            self.assertEqual(render_all([job, job]), 2)
+        self.assertEqual(rendered.call_count, 2)
+        timed.assert_not_called()
+
+    def test_should_raise_on_unknown_kind(self):
+        with self.assertRaises(PlotRenderError):
+            PlotJob("plot.png", "pie", {}, (4, 4), {})
+
+    def test_should_return_none_for_missing_file(self):
+        self.assertIsNone(stored_digest("missing.png"))
+
+    def test_should_not_import_plotting_libraries_before_rendering(self):
+        code = (
+            "import sys, app.database_analyze; "
+            "print(*(m for m in ('matplotlib', 'seaborn') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "")
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from importlib.util import find_spec
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+from app.image_metrics import ImageMetrics
+from app.si_cf_kernel import (
+    SiCfBackend,
+    compiled_kernel,
+    fused_sums,
+    resolve_backend,
+)
+
+
+class TestSiCfKernel(TestCase):
+    def setUp(self) -> None:
+        self.img = np.random.default_rng(0).integers(0, 256, (9, 11, 3), np.uint8)
+
+    def test_should_match_opencv_sobel_sums(self):
+        gx = cv2.Sobel(self.img, cv2.CV_64F, 1, 0, ksize=3)
+        gy = cv2.Sobel(self.img, cv2.CV_64F, 0, 1, ksize=3)
+        sobel, _ = fused_sums(self.img, 0, self.img.shape[0])
+        np.testing.assert_array_equal(sobel, (gx ** 2 + gy ** 2).sum(axis=(0, 1)))
+
+    def test_should_calculate_opponent_moments(self):
+        b, g, r = (self.img[:, :, c].astype(float) for c in range(3))
+        rg, yb = r - g, 0.5 * (r + g) - b
+        _, moments = fused_sums(self.img, 0, self.img.shape[0])
+        np.testing.assert_allclose(
+            moments, [[rg.sum(), (rg ** 2).sum()], [yb.sum(), (yb ** 2).sum()]]
+        )
+
+    def test_should_give_same_sums_for_strips(self):
+        sobel, moments = fused_sums(self.img, 0, self.img.shape[0])
+        top_sobel, top_moments = fused_sums(self.img, 0, 4)
+        bottom_sobel, bottom_moments = fused_sums(self.img, 4, self.img.shape[0])
+        np.testing.assert_array_equal(top_sobel + bottom_sobel, sobel)
+        np.testing.assert_array_equal(top_moments + bottom_moments, moments)
+
+    def test_should_fall_back_to_opencv_without_numba(self):
+        with patch("app.si_cf_kernel.compiled_kernel", return_value=None):
+            self.assertEqual(resolve_backend(SiCfBackend.FUSED), SiCfBackend.OPENCV)
+        self.assertEqual(resolve_backend(SiCfBackend.OPENCV), SiCfBackend.OPENCV)
+
+    def test_should_not_import_numba_with_opencv_backend(self):
+        code = (
+            "import sys; from app.image_metrics import ImageMetrics; "
+            "ImageMetrics('tests/assets/fruits.png').calculate_si_cf(); "
+            "print('numba' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "False")
+
+    @skipUnless(find_spec("numba"), "Numba is not installed")
+    def test_should_match_opencv_with_compiled_kernel(self):
+        self.assertIsNotNone(compiled_kernel())
+        expected = ImageMetrics("tests/assets/fruits.png").calculate_si_cf()
+        im = ImageMetrics(
+            "tests/assets/fruits.png", tile_rows=100, backend=SiCfBackend.FUSED
+        )
+        self.assertEqual(im.backend, SiCfBackend.FUSED)
+        np.testing.assert_allclose(im.calculate_si_cf(), expected, rtol=1e-12)
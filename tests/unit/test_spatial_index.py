@@ -0,0 +1,22 @@
+from unittest import TestCase
+
+import numpy as np
+from app.spatial_index import SpatialIndex
+
+
+class TestSpatialIndex(TestCase):
+    def setUp(self) -> None:
+        self.index = SpatialIndex(np.array([[0.5, 0.5], [0.52, 0.5], [0.9, 0.1]]))
+
+    def test_should_calculate_nn_coverage(self):
+        self.assertEqual(self.index.nn_coverage(2.0), 1.0)
+        self.assertLess(self.index.nn_coverage(0.1), 3 * np.pi * 0.1 ** 2)
+
+    def test_should_calculate_union_area(self):
+        area = self.index.union_area(0.1, 512)
+        expected = 2 * np.pi * 0.1 ** 2
+        self.assertGreater(area, expected)
+        self.assertLess(area, 3 * np.pi * 0.1 ** 2)
+
+    def test_should_calculate_point_density(self):
+        self.assertAlmostEqual(self.index.point_density(0.05), 2 / 3)